@@ -1,6 +1,7 @@
 # Import from your actual AF modules
 from .af_load_prompt_history import *
 from .af_save_prompt_history import *
+from .af_prompt_similarity import *
 
 # Import from existing noxin modules (if they still exist)
 from .noxin_chimenode import *
@@ -17,12 +18,16 @@ NODE_CLASS_MAPPINGS = {
     "AFPromptSave": AFPromptSave,
     "AFPromptSearch": AFPromptSearch,
     "AFPromptYAMLManager": AFPromptYAMLManager,
+    "AFPromptSimilar": AFPromptSimilar,
     
     # Original Noxin Nodes (if they still exist)
     "NoxinChime": NoxinChime,
     "NoxinScaledResolution": NoxinScaledResolution,
+    "NoxinResolutionPlanner": NoxinResolutionPlanner,
     "NoxinSimpleMath": NoxinSimpleMath,
-    "NoxinSplitPrompt": NoxinSplitPrompt
+    "NoxinMathExpression": NoxinMathExpression,
+    "NoxinSplitPrompt": NoxinSplitPrompt,
+    "NoxinSplitPromptSweep": NoxinSplitPromptSweep
 }
 
 # A dictionary that contains the friendly/humanly readable titles for the nodes
@@ -32,10 +37,14 @@ NODE_DISPLAY_NAME_MAPPINGS = {
     "AFPromptSave": "AF Save Prompt History", 
     "AFPromptSearch": "AF Prompt Search",
     "AFPromptYAMLManager": "AF Prompt YAML Manager",
+    "AFPromptSimilar": "AF Find Similar Prompts",
     
     # Original Noxin Nodes (if they still exist)
     "NoxinChime": "Noxin Complete Chime",
     "NoxinScaledResolution": "Noxin Scaled Resolutions",
+    "NoxinResolutionPlanner": "Noxin Resolution Planner",
     "NoxinSimpleMath": "Simple Math Operations",
-    "NoxinSplitPrompt": "Split Prompt Organiser"
+    "NoxinMathExpression": "Math Expression",
+    "NoxinSplitPrompt": "Split Prompt Organiser",
+    "NoxinSplitPromptSweep": "Split Prompt Sweep"
 }
\ No newline at end of file
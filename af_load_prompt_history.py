@@ -24,23 +24,23 @@ import yaml
 from datetime import datetime
 import hashlib
 import re
+import json
+import heapq
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
 
-# Global cache for dropdown options
-_af_dropdown_cache = {}
-_af_file_timestamps = {}
+from .af_prompt_library import (findAFYAMLFile, getAFDropdownCache, getAFLibraryFingerprint, getAFLibraryPath,
+                                getAFBlobText)
+from .af_prompt_sampling import sampleAFPrompt
+from .af_prompt_tags import applyAFTagFilter, getAFParsedTagMask, getAFFacetCounts, formatAFFacets, loadAFTagIndex
+
+# Number of libraries searched in parallel by AFPromptSearch
+AF_SEARCH_WORKERS = 4
 
 def getAFYAMLFiles(custom_path="AF-Prompt Archive"):
     """Get list of available YAML files"""
-    try:
-        import folder_paths
-        output_dir = folder_paths.get_output_directory()
-    except:
-        # Fallback
-        my_dir = os.path.dirname(os.path.abspath(__file__))
-        comfyui_root = os.path.dirname(os.path.dirname(my_dir))
-        output_dir = os.path.join(comfyui_root, "output")
-    
-    library_path = os.path.join(output_dir, custom_path.strip())
+    library_path = getAFLibraryPath(custom_path)
     
     if not os.path.exists(library_path):
         return ["No YAML files found"]
@@ -54,16 +54,9 @@ def getAFYAMLFiles(custom_path="AF-Prompt Archive"):
     
     return sorted(yaml_files) if yaml_files else ["No YAML files found"]
 
-def getAFCacheKey(filename, custom_path, filter_by, limit, search_term=""):
+def getAFCacheKey(filename, custom_path, filter_by, limit, search_term="", tag_filter="", tag_mode="and"):
     """Generate a cache key for the dropdown options"""
-    return f"{custom_path}:{filename}:{filter_by}:{limit}:{search_term}"
-
-def getAFFileModTime(yaml_file_path):
-    """Get file modification time, return 0 if file doesn't exist"""
-    try:
-        return os.path.getmtime(yaml_file_path)
-    except:
-        return 0
+    return f"{custom_path}:{filename}:{filter_by}:{limit}:{search_term}:{tag_filter}:{tag_mode}"
 
 def searchInPrompt(prompt_data, search_term):
     """Search within a prompt entry"""
@@ -95,41 +88,24 @@ def searchInPrompt(prompt_data, search_term):
     
     return False
 
-def getAFPrompts(filename, custom_path="AF-Prompt Archive", filter_by="recent", limit=50, search_term=""):
+def getAFPrompts(filename, custom_path="AF-Prompt Archive", filter_by="recent", limit=50, search_term="", tag_filter="", tag_mode="and"):
     """Get prompts from YAML file with caching and search"""
     if not filename or filename == "No YAML files found" or filename == "":
         return ["Empty Library"]
     
-    try:
-        import folder_paths
-        output_dir = folder_paths.get_output_directory()
-    except:
-        my_dir = os.path.dirname(os.path.abspath(__file__))
-        comfyui_root = os.path.dirname(os.path.dirname(my_dir))
-        output_dir = os.path.join(comfyui_root, "output")
-    
-    library_path = os.path.join(output_dir, custom_path.strip())
-    
-    # Try both extensions
-    yaml_file_path = None
-    for ext in ['.yaml', '.yml']:
-        test_path = os.path.join(library_path, filename + ext)
-        if os.path.exists(test_path):
-            yaml_file_path = test_path
-            break
+    yaml_file_path = findAFYAMLFile(filename, custom_path)
     
     if not yaml_file_path:
         return ["Empty Library"]
     
-    # Check cache
-    cache_key = getAFCacheKey(filename, custom_path, filter_by, limit, search_term)
-    current_mod_time = getAFFileModTime(yaml_file_path)
+    # Check cache, entries are dropped when the file is rewritten
+    cache = getAFDropdownCache()
+    cache_key = getAFCacheKey(filename, custom_path, filter_by, limit, search_term, tag_filter, tag_mode)
+    file_version = cache.version(yaml_file_path)
     
-    # If we have cached data and file hasn't changed, return cached version
-    if (cache_key in _af_dropdown_cache and 
-        cache_key in _af_file_timestamps and 
-        _af_file_timestamps[cache_key] == current_mod_time):
-        return _af_dropdown_cache[cache_key]
+    cached = cache.get(cache_key, yaml_file_path, file_version)
+    if cached is not None:
+        return cached
     
     # Generate fresh data
     prompts = []
@@ -140,7 +116,11 @@ def getAFPrompts(filename, custom_path="AF-Prompt Archive", filter_by="recent",
         # Extract prompts from YAML structure
         prompts_data = data.get('prompts', [])
         
-        # Filter by search term first
+        # Tag filter first, it relies on the file order of the entries
+        if tag_filter.strip():
+            prompts_data = applyAFTagFilter(yaml_file_path, prompts_data, tag_filter, tag_mode)[0]
+        
+        # Filter by search term
         if search_term.strip():
             prompts_data = [p for p in prompts_data if searchInPrompt(p, search_term.strip())]
         
@@ -187,18 +167,30 @@ def getAFPrompts(filename, custom_path="AF-Prompt Archive", filter_by="recent",
     except Exception as e:
         result = [f"Error: {str(e)}"]
         # Cache error result too
-        _af_dropdown_cache[cache_key] = result
-        _af_file_timestamps[cache_key] = current_mod_time
+        cache.put(cache_key, yaml_file_path, result, file_version)
         return result
     
     result = [""] + prompts if prompts else ["Empty Library"]
     
     # Cache the result
-    _af_dropdown_cache[cache_key] = result
-    _af_file_timestamps[cache_key] = current_mod_time
+    cache.put(cache_key, yaml_file_path, result, file_version)
     
     return result
 
+def getAFGenerationData(prompt_data, library_path, load_blobs=False):
+    """JSON of the workflow/generation blobs linked to an entry, or just their hashes"""
+    blobs = prompt_data.get('generation_blobs') or {}
+    if not isinstance(blobs, dict) or not blobs:
+        return ""
+    if not load_blobs:
+        return json.dumps(blobs)
+    
+    parts = []
+    for name, blob_hash in blobs.items():
+        blob_text = getAFBlobText(library_path, str(blob_hash))
+        parts.append(f"{json.dumps(name)}:{blob_text if blob_text is not None else 'null'}")
+    return "{" + ",".join(parts) + "}"
+
 class AFPromptLoad:
     
     def __init__(self):
@@ -220,11 +212,22 @@ class AFPromptLoad:
             "optional": {
                 "search_term": ("STRING", {"default": "", "multiline": False}),
                 "refresh_trigger": ("INT", {"default": 0, "min": 0, "max": 999999}),
+                # Fetch the captured workflow/generation settings, otherwise only their hashes are returned
+                "load_generation_data": ("BOOLEAN", {"default": False}),
+                # sample picks a seeded random prompt on every execution instead of selected_prompt
+                "mode": (["select", "sample"], {"default": "select"}),
+                "seed": ("INT", {"default": 0, "min": 0, "max": 0xffffffffffffffff}),
+                # Optional sampling weights, e.g. "best:5, good:2", and recency half-life in entries (0 = off)
+                "weight_tags": ("STRING", {"default": "", "multiline": False}),
+                "recency_half_life": ("INT", {"default": 0, "min": 0, "max": 10000000}),
+                # Tag filter like "portrait, studio, -nsfw", tag_mode and = all included tags, or = any
+                "tag_filter": ("STRING", {"default": "", "multiline": False}),
+                "tag_mode": (["and", "or"], {"default": "and"}),
             }
         }
 
-    RETURN_TYPES = ("STRING", "STRING", "STRING", "STRING", "STRING",)
-    RETURN_NAMES = ("prompt", "generation_id", "timestamp", "tags", "notes",)
+    RETURN_TYPES = ("STRING", "STRING", "STRING", "STRING", "STRING", "STRING", "STRING",)
+    RETURN_NAMES = ("prompt", "generation_id", "timestamp", "tags", "notes", "generation_data", "facets",)
     
     FUNCTION = "main"
     CATEGORY = "AF Nodes"
@@ -234,57 +237,29 @@ class AFPromptLoad:
         """Force refresh when parameters change"""
         # Create a hash of all parameters to detect changes
         param_string = f"{filename}:{custom_path}:{filter_by}:{limit}:{search_term}:{refresh_trigger}"
+        param_string += "".join(f":{key}={kwargs[key]}" for key in sorted(kwargs))
         
-        # Also check file modification time
-        try:
-            import folder_paths
-            output_dir = folder_paths.get_output_directory()
-        except:
-            my_dir = os.path.dirname(os.path.abspath(__file__))
-            comfyui_root = os.path.dirname(os.path.dirname(my_dir))
-            output_dir = os.path.join(comfyui_root, "output")
-        
-        library_path = os.path.join(output_dir, custom_path.strip())
-        
-        for ext in ['.yaml', '.yml']:
-            yaml_file_path = os.path.join(library_path, filename + ext)
-            if os.path.exists(yaml_file_path):
-                try:
-                    mod_time = os.path.getmtime(yaml_file_path)
-                    param_string += f":{mod_time}"
-                    break
-                except:
-                    pass
+        # Also check the exact library fingerprint (write generation, mtime_ns, size)
+        yaml_file_path = findAFYAMLFile(filename, custom_path)
+        if yaml_file_path:
+            param_string += ":{}:{}:{}".format(*getAFLibraryFingerprint(yaml_file_path))
         
         return hashlib.md5(param_string.encode()).hexdigest()
 
-    def main(self, filename, custom_path, filter_by, limit, selected_prompt, search_term="", refresh_trigger=0):
+    def main(self, filename, custom_path, filter_by, limit, selected_prompt, search_term="", refresh_trigger=0, load_generation_data=False,
+             mode="select", seed=0, weight_tags="", recency_half_life=0, tag_filter="", tag_mode="and"):
         
-        if not selected_prompt or selected_prompt == "Empty Library" or selected_prompt == "":
-            return ("", "", "", "", "")
+        if mode == "sample":
+            return self.sample(filename, custom_path, seed, weight_tags, recency_half_life, load_generation_data) + ("",)
         
-        # Parse the display format to extract the actual data
-        try:
-            # Get the YAML data to find the full prompt
-            import folder_paths
-            output_dir = folder_paths.get_output_directory()
-        except:
-            my_dir = os.path.dirname(os.path.abspath(__file__))
-            comfyui_root = os.path.dirname(os.path.dirname(my_dir))
-            output_dir = os.path.join(comfyui_root, "output")
-        
-        library_path = os.path.join(output_dir, custom_path.strip())
+        if not selected_prompt or selected_prompt == "Empty Library" or selected_prompt == "":
+            return ("", "", "", "", "", "", "")
         
         # Find the YAML file
-        yaml_file_path = None
-        for ext in ['.yaml', '.yml']:
-            test_path = os.path.join(library_path, filename + ext)
-            if os.path.exists(test_path):
-                yaml_file_path = test_path
-                break
+        yaml_file_path = findAFYAMLFile(filename, custom_path)
         
         if not yaml_file_path:
-            return ("", "", "", "", "")
+            return ("", "", "", "", "", "", "")
         
         try:
             # Extract index from selected prompt format: [1] timestamp id preview
@@ -300,6 +275,13 @@ class AFPromptLoad:
                     prompts_data = data.get('prompts', [])
                     
                     # Apply same filtering and searching as in getAFPrompts
+                    if tag_filter.strip():
+                        prompts_data, tag_count, tag_bitsets, tag_mask = applyAFTagFilter(yaml_file_path, prompts_data, tag_filter, tag_mode)
+                    else:
+                        # Facets of the whole library, straight from the index
+                        (tag_count, tag_bitsets), tag_mask = loadAFTagIndex(yaml_file_path), None
+                    facets = formatAFFacets(getAFFacetCounts(tag_count, tag_bitsets, tag_mask))
+                    
                     if search_term.strip():
                         prompts_data = [p for p in prompts_data if searchInPrompt(p, search_term.strip())]
                     
@@ -324,14 +306,117 @@ class AFPromptLoad:
                         # Format tags as string
                         tags_str = ", ".join(tags) if isinstance(tags, list) else str(tags) if tags else ""
                         
+                        # Blobs are only read when asked for
+                        generation_data = getAFGenerationData(prompt_data, os.path.dirname(yaml_file_path), load_generation_data)
+                        
                         print(f"AF Prompt Load: Loaded prompt {index+1} from {filename}.yaml")
-                        return (prompt_text, generation_id, timestamp, tags_str, notes)
+                        return (prompt_text, generation_id, timestamp, tags_str, notes, generation_data, facets)
             
         except Exception as e:
             print(f"AF Prompt Load: Error parsing selection - {str(e)}")
-            return (selected_prompt, "", "", "", "")
+            return (selected_prompt, "", "", "", "", "", "")
         
-        return ("", "", "", "", "")
+        return ("", "", "", "", "", "", "")
+
+    def sample(self, filename, custom_path, seed, weight_tags, recency_half_life, load_generation_data):
+        """Seeded (optionally weighted) random prompt in constant time per pick"""
+        yaml_file_path = findAFYAMLFile(filename, custom_path)
+        if not yaml_file_path:
+            return ("", "", "", "", "", "")
+        
+        try:
+            picked = sampleAFPrompt(yaml_file_path, seed, weight_tags, recency_half_life)
+        except Exception as e:
+            print(f"AF Prompt Load: Error sampling - {str(e)}")
+            return ("", "", "", "", "", "")
+        
+        if picked is None:
+            return ("", "", "", "", "", "")
+        
+        index, prompt_data = picked
+        tags = prompt_data.get('tags', [])
+        tags_str = ", ".join(tags) if isinstance(tags, list) else str(tags) if tags else ""
+        generation_data = getAFGenerationData(prompt_data, os.path.dirname(yaml_file_path), load_generation_data)
+        
+        print(f"AF Prompt Load: Sampled prompt {index+1} from {filename} (seed {seed})")
+        return (prompt_data.get('text', ''), prompt_data.get('generation_id', ''), prompt_data.get('timestamp', ''),
+                tags_str, prompt_data.get('notes', ''), generation_data)
+
+def matchPromptRank(prompt_data, search_term_lower, search_in):
+    """Return match rank (0 text, 1 tags, 2 notes) of a prompt entry, None if it doesn't match"""
+    if search_in == "all" or search_in == "text":
+        if search_term_lower in prompt_data.get('text', '').lower():
+            return 0
+    
+    if search_in == "all" or search_in == "tags":
+        tags = prompt_data.get('tags', [])
+        if isinstance(tags, list):
+            for tag in tags:
+                if search_term_lower in str(tag).lower():
+                    return 1
+    
+    if search_in == "all" or search_in == "notes":
+        notes = prompt_data.get('notes', '')
+        if search_term_lower in notes.lower():
+            return 2
+    
+    return None
+
+def getAFTimestampValue(timestamp):
+    """Convert an ISO timestamp to seconds for ordering, 0 if it can't be parsed"""
+    try:
+        return datetime.fromisoformat(timestamp.replace('Z', '+00:00')).timestamp()
+    except:
+        return 0.0
+
+def searchAFLibrary(library_name, custom_path, search_term_lower, search_in, limit, tag_filter="", tag_mode="and"):
+    """Best matches of one library as sorted (rank, -time, library, index, entry) tuples, plus facet counts of all matches"""
+    yaml_file_path = findAFYAMLFile(library_name, custom_path)
+    if not yaml_file_path:
+        return [], []
+    
+    with open(yaml_file_path, 'r', encoding='utf-8') as yamlfile:
+        data = yaml.safe_load(yamlfile) or {}
+    
+    prompts_data = data.get('prompts', [])
+    count, bitsets, tag_mask = getAFParsedTagMask(yaml_file_path, prompts_data, tag_filter, tag_mode)
+    
+    matches = []
+    match_mask = 0
+    for idx, prompt_data in enumerate(prompts_data):
+        if tag_mask is not None and not tag_mask >> idx & 1:
+            continue
+        rank = matchPromptRank(prompt_data, search_term_lower, search_in)
+        if rank is not None:
+            match_mask |= 1 << idx
+            matches.append((rank, -getAFTimestampValue(prompt_data.get('timestamp', '')), library_name, idx, prompt_data))
+    
+    # No library can contribute more than limit results to the merged list
+    return heapq.nsmallest(limit, matches, key=lambda m: m[:4]), getAFFacetCounts(count, bitsets, match_mask)
+
+def searchAFLibraries(custom_path, search_term, search_in, limit, max_workers=AF_SEARCH_WORKERS, tag_filter="", tag_mode="and"):
+    """Search every library of custom_path concurrently, merged best match first, plus summed facet counts"""
+    libraries = [name for name in getAFYAMLFiles(custom_path) if name != "No YAML files found"]
+    if not libraries:
+        return [], []
+    
+    search_term_lower = search_term.lower()
+    per_library = []
+    facets = Counter()
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(libraries))) as executor:
+        futures = [executor.submit(searchAFLibrary, name, custom_path, search_term_lower, search_in, limit, tag_filter, tag_mode)
+                   for name in libraries]
+        for name, future in zip(libraries, futures):
+            try:
+                matches, library_facets = future.result()
+                per_library.append(matches)
+                facets.update(dict(library_facets))
+            except Exception as e:
+                print(f"AF Prompt Search: Skipping {name} - {str(e)}")
+    
+    # Each list is already sorted, merge lazily and stop at limit
+    merged = list(islice(heapq.merge(*per_library, key=lambda m: m[:4]), limit))
+    return merged, sorted(facets.items(), key=lambda f: (-f[1], f[0]))
 
 # Utility node for advanced prompt operations
 class AFPromptSearch:
@@ -349,39 +434,51 @@ class AFPromptSearch:
                 "search_term": ("STRING", {"default": "", "multiline": False}),
                 "search_in": (["text", "tags", "notes", "all"], {"default": "all"}),
                 "limit": ("INT", {"default": 10, "min": 1, "max": 50, "step": 1}),
+            },
+            "optional": {
+                # all_libraries searches every YAML file in custom_path, ranked text > tags > notes, newest first
+                "search_scope": (["selected_file", "all_libraries"], {"default": "selected_file"}),
+                # Tag filter like "portrait, -nsfw", allows searching by tags only with an empty search_term
+                "tag_filter": ("STRING", {"default": "", "multiline": False}),
+                "tag_mode": (["and", "or"], {"default": "and"}),
             }
         }
 
-    RETURN_TYPES = ("STRING", "STRING",)
-    RETURN_NAMES = ("search_results", "count",)
+    RETURN_TYPES = ("STRING", "STRING", "STRING",)
+    RETURN_NAMES = ("search_results", "count", "facets",)
+    
+    @classmethod
+    def IS_CHANGED(cls, filename, custom_path, search_term, search_in, limit, search_scope="selected_file", **kwargs):
+        """Re-run when parameters or any searched library change"""
+        param_string = f"{filename}:{custom_path}:{search_term}:{search_in}:{limit}:{search_scope}"
+        param_string += "".join(f":{key}={kwargs[key]}" for key in sorted(kwargs))
+        
+        if search_scope == "all_libraries":
+            libraries = [name for name in getAFYAMLFiles(custom_path) if name != "No YAML files found"]
+        else:
+            libraries = [filename]
+        for library_name in libraries:
+            yaml_file_path = findAFYAMLFile(library_name, custom_path)
+            if yaml_file_path:
+                param_string += ":{}={}:{}:{}".format(library_name, *getAFLibraryFingerprint(yaml_file_path))
+        
+        return hashlib.md5(param_string.encode()).hexdigest()
     
     FUNCTION = "search_prompts"
     CATEGORY = "AF Nodes"
 
-    def search_prompts(self, filename, custom_path, search_term, search_in, limit):
-        if not filename or filename == "No YAML files found" or not search_term.strip():
-            return ("No results", "0")
-        
-        try:
-            import folder_paths
-            output_dir = folder_paths.get_output_directory()
-        except:
-            my_dir = os.path.dirname(os.path.abspath(__file__))
-            comfyui_root = os.path.dirname(os.path.dirname(my_dir))
-            output_dir = os.path.join(comfyui_root, "output")
+    def search_prompts(self, filename, custom_path, search_term, search_in, limit, search_scope="selected_file",
+                       tag_filter="", tag_mode="and"):
+        if search_scope == "all_libraries":
+            return self.search_all_libraries(custom_path, search_term, search_in, limit, tag_filter, tag_mode)
         
-        library_path = os.path.join(output_dir, custom_path.strip())
+        if not filename or filename == "No YAML files found" or not (search_term.strip() or tag_filter.strip()):
+            return ("No results", "0", "")
         
-        # Find YAML file
-        yaml_file_path = None
-        for ext in ['.yaml', '.yml']:
-            test_path = os.path.join(library_path, filename + ext)
-            if os.path.exists(test_path):
-                yaml_file_path = test_path
-                break
+        yaml_file_path = findAFYAMLFile(filename, custom_path)
         
         if not yaml_file_path:
-            return ("File not found", "0")
+            return ("File not found", "0", "")
         
         try:
             with open(yaml_file_path, 'r', encoding='utf-8') as yamlfile:
@@ -390,42 +487,33 @@ class AFPromptSearch:
             prompts_data = data.get('prompts', [])
             search_term_lower = search_term.lower()
             results = []
+            tag_count, tag_bitsets, tag_mask = getAFParsedTagMask(yaml_file_path, prompts_data, tag_filter, tag_mode)
+            # A tag-only search matches every entry in tag_mask, so its facets need no scan
+            scan_all = bool(search_term.strip())
+            match_mask = 0
             
             for idx, prompt_data in enumerate(prompts_data):
-                match = False
-                
-                if search_in == "all" or search_in == "text":
-                    if search_term_lower in prompt_data.get('text', '').lower():
-                        match = True
-                
-                if search_in == "all" or search_in == "tags":
-                    tags = prompt_data.get('tags', [])
-                    if isinstance(tags, list):
-                        for tag in tags:
-                            if search_term_lower in str(tag).lower():
-                                match = True
-                                break
-                
-                if search_in == "all" or search_in == "notes":
-                    notes = prompt_data.get('notes', '')
-                    if search_term_lower in notes.lower():
-                        match = True
-                
-                if match:
+                if tag_mask is not None and not tag_mask >> idx & 1:
+                    continue
+                if matchPromptRank(prompt_data, search_term_lower, search_in) is not None:
+                    if len(results) >= limit:
+                        if not scan_all:
+                            break
+                        # Keep scanning after limit, facets count every match of the search term
+                        match_mask |= 1 << idx
+                        continue
+                    match_mask |= 1 << idx
+                    
                     # Format result
                     text = prompt_data.get('text', '')
                     preview = text.replace('\n', ' | ')[:80]
                     if len(text) > 80:
                         preview += "..."
                     
-                    timestamp = prompt_data.get('timestamp', '')
                     gen_id = prompt_data.get('generation_id', '')
                     
                     result_line = f"[{len(results)+1}] {gen_id[:8]} {preview}"
                     results.append(result_line)
-                    
-                    if len(results) >= limit:
-                        break
             
             if results:
                 results_text = "\n".join(results)
@@ -434,10 +522,35 @@ class AFPromptSearch:
                 results_text = "No matches found"
                 count = "0"
             
-            return (results_text, count)
+            facets = formatAFFacets(getAFFacetCounts(tag_count, tag_bitsets, match_mask if scan_all else tag_mask))
+            return (results_text, count, facets)
             
         except Exception as e:
-            return (f"Error: {str(e)}", "0")
+            return (f"Error: {str(e)}", "0", "")
+
+    def search_all_libraries(self, custom_path, search_term, search_in, limit, tag_filter="", tag_mode="and"):
+        if not (search_term.strip() or tag_filter.strip()):
+            return ("No results", "0", "")
+        
+        try:
+            matches, facets = searchAFLibraries(custom_path, search_term.strip(), search_in, limit,
+                                                tag_filter=tag_filter, tag_mode=tag_mode)
+        except Exception as e:
+            return (f"Error: {str(e)}", "0", "")
+        
+        if not matches:
+            return ("No matches found", "0", "")
+        
+        results = []
+        for rank, neg_time, library_name, idx, prompt_data in matches:
+            text = prompt_data.get('text', '')
+            preview = text.replace('\n', ' | ')[:80]
+            if len(text) > 80:
+                preview += "..."
+            gen_id = prompt_data.get('generation_id', '')
+            results.append(f"[{len(results)+1}] [{library_name}] {gen_id[:8]} {preview}")
+        
+        return ("\n".join(results), str(len(results)), formatAFFacets(facets))
 
 # Node mappings for ComfyUI
 NODE_CLASS_MAPPINGS = {
@@ -0,0 +1,424 @@
+# ****** ComfyUI_NoxinNodes_Extended | AF Prompt Library ******
+#
+# Creator: Alex Furer | Co-Creator(s): Claude AI | Original author: Noxin https://github.com/noxinias/ComfyUI_NoxinNodes
+#
+# LICENSE: MIT License
+#
+# v0.1.0
+#   - Shared library path helpers
+#   - Bounded LRU dropdown cache with per-file generation invalidation
+#   - Exact library fingerprints (persisted write generation + mtime_ns + size)
+#   - Streaming (constant memory) library reader and writer
+#   - Content-addressed blob store for workflow/generation metadata, with garbage collection
+#
+# Description:
+# Shared helpers used by the AF prompt history nodes (load, save, search, manager)
+
+import os
+import re
+import gzip
+import json
+import shutil
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from functools import lru_cache
+
+import yaml
+
+# Maximum number of (file, filter, limit, search) combinations kept in the dropdown cache
+AF_DROPDOWN_CACHE_SIZE = 64
+
+# Folder inside each library path holding sidecar files (write generations, indexes, ...)
+AF_SIDECAR_DIR = ".af_meta"
+
+# Folder inside each library path holding content-addressed workflow/generation blobs
+AF_BLOB_DIR = ".af_blobs"
+
+# Unreferenced blobs younger than this many seconds are kept, a save may be about to reference them
+AF_BLOB_GC_GRACE = 600
+
+# (custom_path, filename) -> last resolved YAML path, so lookups need a single stat
+_af_resolved_paths = {}
+_af_generation_lock = threading.Lock()
+_af_library_locks = {}
+
+def getAFOutputDir():
+    """Get ComfyUI's output directory"""
+    try:
+        import folder_paths
+        return folder_paths.get_output_directory()
+    except:
+        # Fallback: use default ComfyUI structure if folder_paths import fails
+        my_dir = os.path.dirname(os.path.abspath(__file__))
+        comfyui_root = os.path.dirname(os.path.dirname(my_dir))
+        return os.path.join(comfyui_root, "output")
+
+def getAFLibraryPath(custom_path="AF-Prompt Archive"):
+    """Get the folder holding the YAML libraries for custom_path"""
+    return os.path.join(getAFOutputDir(), custom_path.strip())
+
+def findAFYAMLFile(filename, custom_path="AF-Prompt Archive"):
+    """Return the path of filename.yaml or filename.yml, None if neither exists"""
+    resolved_key = (custom_path, filename)
+    cached_path = _af_resolved_paths.get(resolved_key)
+    if cached_path and os.path.exists(cached_path):
+        return cached_path
+    
+    library_path = getAFLibraryPath(custom_path)
+    for ext in ['.yaml', '.yml']:
+        test_path = os.path.join(library_path, filename + ext)
+        if os.path.exists(test_path):
+            _af_resolved_paths[resolved_key] = test_path
+            return test_path
+    _af_resolved_paths.pop(resolved_key, None)
+    return None
+
+def getAFSidecarPath(yaml_file_path, suffix):
+    """Path of a sidecar file belonging to a library, e.g. <library>/.af_meta/Global_Positive.yaml.gen"""
+    library_path, yaml_name = os.path.split(yaml_file_path)
+    return os.path.join(library_path, AF_SIDECAR_DIR, yaml_name + "." + suffix)
+
+def writeAFSidecarAtomic(sidecar_path, content, mode='w'):
+    """Write a sidecar file via a temp file + rename so readers never see half a file"""
+    os.makedirs(os.path.dirname(sidecar_path), exist_ok=True)
+    tmp_path = f"{sidecar_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, mode, **({} if 'b' in mode else {'encoding': 'utf-8'})) as f:
+        f.write(content)
+    os.replace(tmp_path, sidecar_path)
+
+def getAFLibraryLock(yaml_file_path):
+    """Per-library lock held while a library is being rewritten"""
+    file_key = os.path.normcase(os.path.abspath(yaml_file_path))
+    with _af_generation_lock:
+        return _af_library_locks.setdefault(file_key, threading.RLock())
+
+def getAFFileStamp(yaml_file_path):
+    """Get exact (mtime_ns, size) of a file, (0, 0) if it doesn't exist"""
+    try:
+        st = os.stat(yaml_file_path)
+        return (st.st_mtime_ns, st.st_size)
+    except OSError:
+        return (0, 0)
+
+def readAFWriteGeneration(yaml_file_path):
+    """Persisted write generation of a library, 0 if it was never bumped"""
+    try:
+        with open(getAFSidecarPath(yaml_file_path, "gen"), 'r', encoding='utf-8') as f:
+            return int(f.read().strip() or 0)
+    except (OSError, ValueError):
+        return 0
+
+def getAFLibraryFingerprint(yaml_file_path):
+    """Exact (write_generation, mtime_ns, size) of a library.
+
+    The generation is bumped by every write through these nodes, so two saves
+    within the filesystem's timestamp granularity still differ; mtime_ns and
+    size catch edits made outside of ComfyUI.
+    """
+    return (readAFWriteGeneration(yaml_file_path),) + getAFFileStamp(yaml_file_path)
+
+class AFDropdownCache:
+    """Size-bounded LRU cache for dropdown options, invalidated per file.
+
+    Every entry remembers the file it was built from together with that file's
+    fingerprint (see getAFLibraryFingerprint). Writers call invalidate() after
+    saving, which drops all entries of that file at once.
+    """
+
+    def __init__(self, max_entries=AF_DROPDOWN_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (file_key, version, value)
+        self._file_keys = {}  # file_key -> set of cache keys
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def _file_key(yaml_file_path):
+        return os.path.normcase(os.path.abspath(yaml_file_path))
+
+    def version(self, yaml_file_path):
+        """Current (generation, mtime_ns, size) of a file"""
+        return getAFLibraryFingerprint(yaml_file_path)
+
+    def get(self, key, yaml_file_path, version=None):
+        """Return cached value for key, or None if missing or stale"""
+        if version is None:
+            version = self.version(yaml_file_path)
+        file_key = self._file_key(yaml_file_path)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == file_key and entry[1] == version:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[2]
+            if entry is not None:
+                # Stale entry, drop it right away
+                self._remove(key)
+            self.misses += 1
+            return None
+
+    def put(self, key, yaml_file_path, value, version=None):
+        """Store value for key, evicting the least recently used entries"""
+        if version is None:
+            version = self.version(yaml_file_path)
+        file_key = self._file_key(yaml_file_path)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (file_key, version, value)
+            self._file_keys.setdefault(file_key, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                oldest_key = next(iter(self._entries))
+                self._remove(oldest_key)
+                self.evictions += 1
+
+    def invalidate(self, yaml_file_path):
+        """Drop all cached entries of a file"""
+        file_key = self._file_key(yaml_file_path)
+        with self._lock:
+            for key in list(self._file_keys.get(file_key, ())):
+                self._remove(key)
+            self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._file_keys.clear()
+
+    def stats(self):
+        """Hit/miss statistics of the cache"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+            }
+
+    def _remove(self, key):
+        # Caller must hold the lock
+        file_key = self._entries.pop(key)[0]
+        keys = self._file_keys.get(file_key)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._file_keys[file_key]
+
+# Global cache for dropdown options
+_af_dropdown_cache = AFDropdownCache()
+
+def getAFDropdownCache():
+    """Get the shared dropdown cache"""
+    return _af_dropdown_cache
+
+def getAFDropdownCacheStats():
+    """Get hit/miss statistics of the shared dropdown cache"""
+    return _af_dropdown_cache.stats()
+
+def bumpAFFileGeneration(yaml_file_path):
+    """Tell readers that yaml_file_path has been rewritten, returns the new write generation"""
+    with _af_generation_lock:
+        generation = readAFWriteGeneration(yaml_file_path) + 1
+        try:
+            writeAFSidecarAtomic(getAFSidecarPath(yaml_file_path, "gen"), str(generation))
+        except OSError as e:
+            print(f"AF Prompt Library: Could not persist write generation - {str(e)}")
+    _af_dropdown_cache.invalidate(yaml_file_path)
+    return generation
+
+def iterAFLibrary(yaml_file_path):
+    """Stream a library as ('metadata', dict) and ('prompt', entry) items.
+
+    Uses PyYAML's event parser and composes one prompt entry at a time, so
+    memory stays constant however long the prompts list is.
+    """
+    with open(yaml_file_path, 'r', encoding='utf-8') as f:
+        loader = yaml.SafeLoader(f)
+        try:
+            loader.get_event()  # StreamStartEvent
+            if not loader.check_event(yaml.DocumentStartEvent):
+                return
+            loader.get_event()
+            if not loader.check_event(yaml.MappingStartEvent):
+                return
+            loader.get_event()
+            while not loader.check_event(yaml.MappingEndEvent):
+                key = loader.construct_document(loader.compose_node(None, None))
+                if key == 'prompts' and loader.check_event(yaml.SequenceStartEvent):
+                    loader.get_event()
+                    while not loader.check_event(yaml.SequenceEndEvent):
+                        yield ('prompt', loader.construct_document(loader.compose_node(None, None)))
+                        loader.anchors = {}
+                    loader.get_event()
+                else:
+                    value = loader.construct_document(loader.compose_node(None, None))
+                    if key == 'metadata':
+                        yield ('metadata', value or {})
+        finally:
+            loader.dispose()
+
+def iterAFPromptEntries(yaml_file_path):
+    """Stream the prompt entries of a library one at a time"""
+    for kind, value in iterAFLibrary(yaml_file_path):
+        if kind == 'prompt' and isinstance(value, dict):
+            yield value
+
+def readAFLibraryMetadata(yaml_file_path):
+    """Read only the metadata block of a library (it is written before the prompts)"""
+    for kind, value in iterAFLibrary(yaml_file_path):
+        if kind == 'metadata':
+            return value
+        break
+    return {}
+
+def parseAFTimestamp(timestamp):
+    """Parse an ISO timestamp into a naive datetime, None if empty or invalid"""
+    if not timestamp:
+        return None
+    try:
+        dt = datetime.fromisoformat(str(timestamp).strip().replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    return dt.replace(tzinfo=None) if dt.tzinfo is None else dt.astimezone().replace(tzinfo=None)
+
+def filterAFPromptEntries(entries, since="", until="", tag=""):
+    """Lazily filter entries by time range (ISO strings, inclusive) and tag"""
+    since_dt = parseAFTimestamp(since)
+    until_dt = parseAFTimestamp(until)
+    tag = tag.strip().lower()
+    for entry in entries:
+        if since_dt or until_dt:
+            entry_dt = parseAFTimestamp(entry.get('timestamp', ''))
+            if entry_dt is None or (since_dt and entry_dt < since_dt) or (until_dt and entry_dt > until_dt):
+                continue
+        if tag:
+            tags = entry.get('tags', [])
+            if not isinstance(tags, list) or tag not in (str(t).strip().lower() for t in tags):
+                continue
+        yield entry
+
+def writeAFLibraryStreamed(yaml_file_path, metadata, entries):
+    """Write a library from an entry iterator in constant memory, returns the entry count.
+
+    Entries are streamed to a temporary body file first so the metadata block,
+    which needs the final count, can still be written before the prompts.
+    """
+    library_path = os.path.dirname(yaml_file_path)
+    os.makedirs(library_path, exist_ok=True)
+    body_path = f"{yaml_file_path}.{os.getpid()}.body.tmp"
+    final_tmp_path = f"{yaml_file_path}.{os.getpid()}.tmp"
+    total = 0
+    try:
+        with open(body_path, 'w', encoding='utf-8') as body:
+            for entry in entries:
+                yaml.dump([entry], body, default_flow_style=False, allow_unicode=True, indent=2, sort_keys=False)
+                total += 1
+        
+        metadata = dict(metadata)
+        metadata['total_prompts'] = total
+        metadata['last_updated'] = datetime.now().isoformat()
+        with open(final_tmp_path, 'w', encoding='utf-8') as f:
+            yaml.dump({'metadata': metadata}, f, default_flow_style=False, allow_unicode=True, indent=2, sort_keys=False)
+            if total:
+                f.write("prompts:\n")
+                with open(body_path, 'r', encoding='utf-8') as body:
+                    shutil.copyfileobj(body, f)
+            else:
+                f.write("prompts: []\n")
+        os.replace(final_tmp_path, yaml_file_path)
+    finally:
+        for tmp_path in (body_path, final_tmp_path):
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+    
+    bumpAFFileGeneration(yaml_file_path)
+    return total
+
+def getAFBlobPath(library_path, blob_hash):
+    """Location of a content-addressed blob, fanned out by the first two hex digits"""
+    return os.path.join(library_path, AF_BLOB_DIR, blob_hash[:2], blob_hash + ".json.gz")
+
+def putAFBlob(library_path, data):
+    """Store a JSON-serialisable object once under its sha256, returns the hash"""
+    canonical = json.dumps(data, sort_keys=True, separators=(',', ':'), ensure_ascii=False, default=str)
+    blob_hash = hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+    blob_path = getAFBlobPath(library_path, blob_hash)
+    try:
+        # Reusing a blob renews its mtime so garbage collection treats it as fresh
+        os.utime(blob_path)
+    except OSError:
+        # mtime=0 keeps the compressed bytes identical for identical content
+        writeAFSidecarAtomic(blob_path, gzip.compress(canonical.encode('utf-8'), mtime=0), mode='wb')
+    return blob_hash
+
+@lru_cache(maxsize=32)
+def getAFBlobText(library_path, blob_hash):
+    """JSON text of a stored blob, None if missing. Blobs never change, so this is cached"""
+    if not re.fullmatch(r'[0-9a-f]{64}', blob_hash or ''):
+        return None
+    try:
+        with gzip.open(getAFBlobPath(library_path, blob_hash), 'rt', encoding='utf-8') as f:
+            return f.read()
+    except OSError:
+        return None
+
+def getAFReferencedBlobs(library_path):
+    """Hashes of all blobs referenced by any library (including backups) in library_path"""
+    referenced = set()
+    for name in os.listdir(library_path):
+        if not name.endswith(('.yaml', '.yml')):
+            continue
+        for entry in iterAFPromptEntries(os.path.join(library_path, name)):
+            blobs = entry.get('generation_blobs') if isinstance(entry, dict) else None
+            if isinstance(blobs, dict):
+                referenced.update(str(blob_hash) for blob_hash in blobs.values())
+    return referenced
+
+def collectAFBlobGarbage(library_path, grace=AF_BLOB_GC_GRACE):
+    """Delete blobs no library entry references anymore, returns (removed, freed bytes).
+
+    Entries pruned to the retention archive lose their blobs as well.
+    """
+    blob_root = os.path.join(library_path, AF_BLOB_DIR)
+    if not os.path.isdir(blob_root):
+        return 0, 0
+    
+    cutoff = time.time() - grace
+    referenced = getAFReferencedBlobs(library_path)
+    removed = freed = 0
+    for fanout in os.listdir(blob_root):
+        fanout_path = os.path.join(blob_root, fanout)
+        if not os.path.isdir(fanout_path):
+            continue
+        for name in os.listdir(fanout_path):
+            if not name.endswith(".json.gz") or name[:-len(".json.gz")] in referenced:
+                continue
+            blob_path = os.path.join(fanout_path, name)
+            try:
+                stat = os.stat(blob_path)
+                if stat.st_mtime >= cutoff:
+                    continue
+                os.remove(blob_path)
+                removed += 1
+                freed += stat.st_size
+            except OSError:
+                pass
+        try:
+            os.rmdir(fanout_path)  # only succeeds once the fan-out folder is empty
+        except OSError:
+            pass
+    
+    if removed:
+        getAFBlobText.cache_clear()
+        print(f"AF Prompt Library: Removed {removed} unreferenced blobs ({freed / 1024:.1f} KB)")
+    return removed, freed
@@ -0,0 +1,207 @@
+# ****** ComfyUI_NoxinNodes_Extended | AF Prompt Retention ******
+#
+# Creator: Alex Furer | Co-Creator(s): Claude AI | Original author: Noxin https://github.com/noxinias/ComfyUI_NoxinNodes
+#
+# LICENSE: MIT License
+#
+# v0.1.0
+#   - Retention policies (max entries, max age, keep tagged forever) per library
+#   - Background compaction with optional gzip JSONL archive of pruned entries
+#
+# Description:
+# Keeps prompt libraries from growing forever. The policy of a library is stored
+# in .af_meta/<file>.yaml.retention.json (set it with the AF Prompt YAML Manager).
+# Saves never rewrite the file for retention; once a library is a bit over its
+# limit, or its age limit is due for a check, a single background worker
+# compacts it with a streaming rewrite.
+
+import os
+import json
+import gzip
+import shutil
+import time
+import threading
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+
+from .af_prompt_library import (collectAFBlobGarbage, getAFSidecarPath, getAFLibraryLock, iterAFLibrary, parseAFTimestamp,
+                                writeAFLibraryStreamed, writeAFSidecarAtomic)
+
+# Compact only once a library is this much over max_entries, so saves don't trigger a rewrite each time
+AF_RETENTION_SLACK = 0.1
+# Minimum seconds between age-based compactions of the same library
+AF_RETENTION_AGE_INTERVAL = 3600
+
+_af_retention_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="AFRetention")
+_af_retention_pending = set()
+_af_retention_last_run = {}
+_af_retention_protected = {}  # yaml_file_path -> number of entries protected by keep_tags, from the last compaction
+_af_retention_lock = threading.Lock()
+
+def readAFRetentionPolicy(yaml_file_path):
+    """Retention policy of a library, {} if none is set"""
+    try:
+        with open(getAFSidecarPath(yaml_file_path, "retention.json"), 'r', encoding='utf-8') as f:
+            return json.load(f) or {}
+    except (OSError, ValueError):
+        return {}
+
+def writeAFRetentionPolicy(yaml_file_path, max_entries=0, max_age_days=0, keep_tags="", archive=True):
+    """Store a retention policy, 0 disables a limit. keep_tags "*" keeps every tagged entry"""
+    policy = {
+        'max_entries': int(max_entries),
+        'max_age_days': int(max_age_days),
+        'keep_tags': [tag.strip().lower() for tag in keep_tags.split(',') if tag.strip()],
+        'archive': bool(archive),
+    }
+    writeAFSidecarAtomic(getAFSidecarPath(yaml_file_path, "retention.json"), json.dumps(policy, indent=2))
+    return policy
+
+def isAFEntryKept(entry, keep_tags):
+    """True if an entry is protected from pruning by its tags"""
+    tags = entry.get('tags', [])
+    if not keep_tags or not isinstance(tags, list) or not tags:
+        return False
+    if '*' in keep_tags:
+        return True
+    return any(str(tag).strip().lower() in keep_tags for tag in tags)
+
+def getAFArchivePath(yaml_file_path):
+    """gzip JSONL file collecting pruned entries of a library"""
+    base, _ = os.path.splitext(yaml_file_path)
+    return base + "_archive.jsonl.gz"
+
+def compactAFLibrary(yaml_file_path, policy=None):
+    """Apply the retention policy with a streaming rewrite, returns the number of pruned entries.
+
+    Entries are assumed to be in save order (oldest first): age-expired entries
+    are dropped, then the oldest unprotected entries until max_entries is met.
+    Entries protected by keep_tags don't count toward max_entries.
+    """
+    policy = readAFRetentionPolicy(yaml_file_path) if policy is None else policy
+    max_entries = policy.get('max_entries', 0)
+    max_age_days = policy.get('max_age_days', 0)
+    keep_tags = policy.get('keep_tags', [])
+    if not max_entries and not max_age_days:
+        return 0
+
+    cutoff = datetime.now() - timedelta(days=max_age_days) if max_age_days else None
+
+    def is_expired(entry):
+        if cutoff is None:
+            return False
+        entry_dt = parseAFTimestamp(entry.get('timestamp', ''))
+        return entry_dt is not None and entry_dt < cutoff
+
+    with getAFLibraryLock(yaml_file_path):
+        if not os.path.exists(yaml_file_path):
+            return 0
+
+        # Pass 1: count the prunable entries surviving the age limit to know how many more to drop
+        metadata = {}
+        protected = 0
+        survivors = 0
+        expired_count = 0
+        for kind, value in iterAFLibrary(yaml_file_path):
+            if kind == 'metadata':
+                metadata = value
+            elif isinstance(value, dict):
+                if isAFEntryKept(value, keep_tags):
+                    protected += 1
+                elif not is_expired(value):
+                    survivors += 1
+                else:
+                    expired_count += 1
+        excess = max(0, survivors - max_entries) if max_entries else 0
+        with _af_retention_lock:
+            _af_retention_protected[yaml_file_path] = protected
+        if max_entries and protected > max_entries:
+            print(f"AF Prompt Retention: {protected} protected prompts in {os.path.basename(yaml_file_path)} "
+                  f"exceed max_entries ({max_entries}), the limit only applies to untagged prompts")
+        if not expired_count and not excess:
+            # Nothing to prune, don't rewrite the file (that would invalidate every index)
+            return 0
+
+        pruned = 0
+        pruned_blobs = False
+        # Pruned entries go to a temporary gzip member first, appended to the archive only on success
+        archive_tmp_path = getAFArchivePath(yaml_file_path) + f".{os.getpid()}.tmp"
+        archive_file = gzip.open(archive_tmp_path, 'wt', encoding='utf-8') if policy.get('archive', True) else None
+
+        # Pass 2: stream the kept entries into the rewritten library
+        def kept_entries():
+            nonlocal excess, pruned, pruned_blobs
+            for kind, value in iterAFLibrary(yaml_file_path):
+                if kind != 'prompt' or not isinstance(value, dict):
+                    continue
+                if not isAFEntryKept(value, keep_tags):
+                    expired = is_expired(value)
+                    if expired or excess > 0:
+                        if not expired:
+                            excess -= 1
+                        pruned += 1
+                        pruned_blobs = pruned_blobs or bool(value.get('generation_blobs'))
+                        if archive_file is not None:
+                            archive_file.write(json.dumps(value, ensure_ascii=False, default=str) + "\n")
+                        continue
+                yield value
+
+        try:
+            metadata = dict(metadata)
+            metadata['last_compacted'] = datetime.now().isoformat()
+            writeAFLibraryStreamed(yaml_file_path, metadata, kept_entries())
+            if archive_file is not None:
+                archive_file.close()
+                if pruned:
+                    # Concatenated gzip members form one valid gzip stream
+                    with open(archive_tmp_path, 'rb') as src, open(getAFArchivePath(yaml_file_path), 'ab') as dst:
+                        shutil.copyfileobj(src, dst)
+        finally:
+            if archive_file is not None:
+                archive_file.close()
+                if os.path.exists(archive_tmp_path):
+                    os.remove(archive_tmp_path)
+
+    print(f"AF Prompt Retention: Pruned {pruned} prompts from {os.path.basename(yaml_file_path)}")
+    if pruned_blobs:
+        collectAFBlobGarbage(os.path.dirname(yaml_file_path))
+    return pruned
+
+def scheduleAFRetention(yaml_file_path, total_prompts, new_entry=None):
+    """Queue a background compaction after a save if the library is due for one.
+
+    Protected entries are excluded from the max_entries check using the count
+    of the last compaction plus the newly saved entry.
+    """
+    policy = readAFRetentionPolicy(yaml_file_path)
+    max_entries = policy.get('max_entries', 0)
+    max_age_days = policy.get('max_age_days', 0)
+    if not max_entries and not max_age_days:
+        return False
+
+    now = time.monotonic()
+    with _af_retention_lock:
+        protected = _af_retention_protected.get(yaml_file_path)
+        if protected is not None and isinstance(new_entry, dict) and isAFEntryKept(new_entry, policy.get('keep_tags', [])):
+            protected += 1
+            _af_retention_protected[yaml_file_path] = protected
+        # Unknown until the first compaction, which then records it
+        prunable = total_prompts - (protected or 0)
+        over_limit = max_entries and prunable > max_entries + max(1, int(max_entries * AF_RETENTION_SLACK))
+        age_due = max_age_days and now - _af_retention_last_run.get(yaml_file_path, -AF_RETENTION_AGE_INTERVAL) >= AF_RETENTION_AGE_INTERVAL
+        if not (over_limit or age_due) or yaml_file_path in _af_retention_pending:
+            return False
+        _af_retention_pending.add(yaml_file_path)
+        _af_retention_last_run[yaml_file_path] = now
+
+    _af_retention_executor.submit(_runAFRetention, yaml_file_path, policy)
+    return True
+
+def _runAFRetention(yaml_file_path, policy):
+    try:
+        compactAFLibrary(yaml_file_path, policy)
+    except Exception as e:
+        print(f"AF Prompt Retention: Compaction of {yaml_file_path} failed - {str(e)}")
+    finally:
+        with _af_retention_lock:
+            _af_retention_pending.discard(yaml_file_path)
@@ -0,0 +1,275 @@
+# ****** ComfyUI_NoxinNodes_Extended | AF Prompt Sampling ******
+#
+# Creator: Alex Furer | Co-Creator(s): Claude AI | Original author: Noxin https://github.com/noxinias/ComfyUI_NoxinNodes
+#
+# LICENSE: MIT License
+#
+# v0.1.0
+#   - Record offset index for libraries (.af_meta/<file>.yaml.offsets.npy)
+#   - Seeded uniform or weighted (tag / recency) sampling via cached alias tables
+#   - Offsets are appended by AFPromptSave, tag weights come from the tag bitmap index
+#
+# Description:
+# Lets AFPromptLoad pick a random prompt per execution without parsing and
+# sorting the whole library. The byte offset of every entry is indexed once per
+# library change; the metadata total_prompts acts as the entry-count header that
+# validates the index. A sample then costs one alias table lookup plus reading
+# and parsing a single entry.
+
+import os
+import json
+import random
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import yaml
+
+from .af_prompt_library import (getAFSidecarPath, getAFLibraryFingerprint, iterAFPromptEntries,
+                                readAFLibraryMetadata, writeAFSidecarAtomic)
+from .af_prompt_tags import iterAFBits, loadAFTagIndex
+
+# Number of alias tables (one per library + weighting) kept in memory
+AF_ALIAS_CACHE_SIZE = 8
+
+_af_offsets_cache = {}  # yaml_file_path -> (fingerprint, offsets)
+_af_alias_cache = OrderedDict()  # (yaml_file_path, fingerprint, weight spec) -> (prob, alias)
+_af_sampling_lock = threading.Lock()
+
+def scanAFRecordOffsets(yaml_file_path):
+    """Byte offsets of the prompt entries, n starts plus the end of the last entry.
+
+    Libraries are written with the prompts list at column 0, so every line
+    starting with "- " after "prompts:" begins an entry; nested content is
+    always indented.
+    """
+    offsets = []
+    position = 0
+    end = None
+    in_prompts = False
+    with open(yaml_file_path, 'rb') as f:
+        for line in f:
+            if not in_prompts:
+                in_prompts = line.rstrip(b'\r\n') == b'prompts:'
+            elif line.startswith(b'- '):
+                offsets.append(position)
+            elif line[:1] not in (b' ', b'\t', b'\r', b'\n', b'#'):
+                end = position  # next top-level key
+                break
+            position += len(line)
+    offsets.append(position if end is None else end)
+    return np.asarray(offsets, dtype=np.int64)
+
+def scanAFFirstRecordOffset(yaml_file_path):
+    """Byte offset of the first prompt entry, only reads the header part of the file"""
+    position = 0
+    in_prompts = False
+    with open(yaml_file_path, 'rb') as f:
+        for line in f:
+            if not in_prompts:
+                in_prompts = line.rstrip(b'\r\n') == b'prompts:'
+            elif line.startswith(b'- '):
+                return position
+            position += len(line)
+    return None
+
+def writeAFRecordOffsets(yaml_file_path, fingerprint, offsets):
+    offsets_path = getAFSidecarPath(yaml_file_path, "offsets.npy")
+    try:
+        tmp_path = f"{offsets_path}.{os.getpid()}.tmp.npy"
+        os.makedirs(os.path.dirname(offsets_path), exist_ok=True)
+        np.save(tmp_path, offsets)
+        os.replace(tmp_path, offsets_path)
+        writeAFSidecarAtomic(getAFSidecarPath(yaml_file_path, "offsets.json"),
+                             json.dumps({'fingerprint': list(fingerprint), 'entries': max(len(offsets) - 1, 0)}))
+    except OSError as e:
+        print(f"AF Prompt Sampling: Could not persist record offsets - {str(e)}")
+
+def loadAFRecordOffsets(yaml_file_path):
+    """Record offsets of a library, None if the file layout can't be indexed"""
+    fingerprint = getAFLibraryFingerprint(yaml_file_path)
+    with _af_sampling_lock:
+        cached = _af_offsets_cache.get(yaml_file_path)
+        if cached and cached[0] == fingerprint:
+            return cached[1]
+
+        offsets_path = getAFSidecarPath(yaml_file_path, "offsets.npy")
+        state_path = getAFSidecarPath(yaml_file_path, "offsets.json")
+        offsets = None
+        try:
+            with open(state_path, 'r', encoding='utf-8') as f:
+                if tuple(json.load(f).get('fingerprint', ())) == tuple(fingerprint):
+                    offsets = np.load(offsets_path)
+        except (OSError, ValueError):
+            offsets = None
+
+        if offsets is None:
+            offsets = scanAFRecordOffsets(yaml_file_path)
+            # The entry-count header must agree with the scan, otherwise the layout is unknown
+            if readAFLibraryMetadata(yaml_file_path).get('total_prompts') != len(offsets) - 1:
+                offsets = np.zeros(0, dtype=np.int64)
+            writeAFRecordOffsets(yaml_file_path, fingerprint, offsets)
+
+        offsets = offsets if len(offsets) > 1 else None
+        _af_offsets_cache[yaml_file_path] = (fingerprint, offsets)
+        return offsets
+
+def appendAFRecordOffset(yaml_file_path, entry, fingerprint_before):
+    """Extend the offsets index by an entry appended by AFPromptSave.
+
+    Only done when the index matched the library right before the save
+    (fingerprint_before). The save re-dumps the whole file, so the earlier
+    entries keep their bytes but move with the size of the metadata block; the
+    new entry must then be exactly the appended tail of the file. Otherwise the
+    index is left stale and rescanned on the next sample.
+    """
+    with _af_sampling_lock:
+        cached = _af_offsets_cache.get(yaml_file_path)
+        if cached is not None and tuple(cached[0]) == tuple(fingerprint_before):
+            offsets = cached[1]
+        else:
+            try:
+                with open(getAFSidecarPath(yaml_file_path, "offsets.json"), 'r', encoding='utf-8') as f:
+                    if tuple(json.load(f).get('fingerprint', ())) != tuple(fingerprint_before):
+                        return False
+                offsets = np.load(getAFSidecarPath(yaml_file_path, "offsets.npy"))
+            except (OSError, ValueError):
+                return False
+        if offsets is None or len(offsets) < 2 or int(offsets[-1]) != fingerprint_before[2]:
+            return False
+
+        first = scanAFFirstRecordOffset(yaml_file_path)
+        if first is None:
+            return False
+        start = int(offsets[-1]) + first - int(offsets[0])
+        entry_bytes = yaml.dump([entry], default_flow_style=False, allow_unicode=True, indent=2, sort_keys=False).encode('utf-8')
+        with open(yaml_file_path, 'rb') as f:
+            f.seek(start)
+            if f.read() != entry_bytes:
+                return False
+
+        offsets = np.append(offsets + (first - int(offsets[0])), start + len(entry_bytes)).astype(np.int64)
+        fingerprint = getAFLibraryFingerprint(yaml_file_path)
+        writeAFRecordOffsets(yaml_file_path, fingerprint, offsets)
+        _af_offsets_cache[yaml_file_path] = (fingerprint, offsets)
+        return True
+
+def readAFEntryAt(yaml_file_path, offsets, index):
+    """Read and parse a single entry by its record offsets"""
+    with open(yaml_file_path, 'rb') as f:
+        f.seek(int(offsets[index]))
+        raw = f.read(int(offsets[index + 1] - offsets[index]))
+    entries = yaml.safe_load(raw.decode('utf-8')) or [{}]
+    return entries[0]
+
+def buildAFAliasTable(weights):
+    """Vose's alias method: O(n) build, O(1) weighted sample"""
+    n = len(weights)
+    total = float(sum(weights))
+    if n == 0 or total <= 0:
+        return None
+    scaled = [w * n / total for w in weights]
+    prob = [0.0] * n
+    alias = list(range(n))
+    small = [i for i, w in enumerate(scaled) if w < 1.0]
+    large = [i for i, w in enumerate(scaled) if w >= 1.0]
+    while small and large:
+        s, l = small.pop(), large.pop()
+        prob[s] = scaled[s]
+        alias[s] = l
+        scaled[l] = scaled[l] + scaled[s] - 1.0
+        (small if scaled[l] < 1.0 else large).append(l)
+    for i in small + large:
+        prob[i] = 1.0
+    return prob, alias
+
+def parseAFTagWeights(weight_tags):
+    """Parse "best:5, good:2" into {'best': 5.0, 'good': 2.0}"""
+    weights = {}
+    for item in weight_tags.split(','):
+        tag, _, value = item.partition(':')
+        if tag.strip():
+            try:
+                weights[tag.strip().lower()] = max(float(value), 0.0) if value.strip() else 2.0
+            except ValueError:
+                pass
+    return weights
+
+def getAFEntryWeights(yaml_file_path, count, weight_tags="", recency_half_life=0):
+    """Sampling weight per entry in file (save) order"""
+    weights = [1.0] * count
+    if recency_half_life > 0:
+        # The newest entry is last; every half_life entries older halves the weight
+        weights = [0.5 ** ((count - 1 - i) / recency_half_life) for i in range(count)]
+    tag_weights = parseAFTagWeights(weight_tags)
+    if not tag_weights:
+        return weights
+
+    tag_count, bitsets = loadAFTagIndex(yaml_file_path)
+    if tag_count == count:
+        # Same rule as below from the tag index: an entry gets the largest factor of its tags,
+        # where unweighted tags count as 1.0, without parsing any entry
+        best = {}
+        for tag, factor in tag_weights.items():
+            for i in iterAFBits(bitsets.get(tag, 0)):
+                best[i] = max(best.get(i, factor), factor)
+        unweighted = 0
+        for tag, bits in bitsets.items():
+            if tag not in tag_weights:
+                unweighted |= bits
+        for i in iterAFBits(unweighted):
+            if i in best:
+                best[i] = max(best[i], 1.0)
+        for i, factor in best.items():
+            weights[i] *= factor
+    else:
+        for i, entry in enumerate(iterAFPromptEntries(yaml_file_path)):
+            if i >= count:
+                break
+            tags = entry.get('tags', [])
+            if isinstance(tags, list):
+                factor = max((tag_weights.get(str(t).strip().lower(), 1.0) for t in tags), default=1.0)
+                weights[i] *= factor
+    return weights
+
+def sampleAFPrompt(yaml_file_path, seed, weight_tags="", recency_half_life=0):
+    """Pick a prompt entry, reproducible for a given seed and library state.
+
+    Returns (index, entry) or None for an empty library. Falls back to a full
+    parse if the library can't be indexed by offsets.
+    """
+    offsets = loadAFRecordOffsets(yaml_file_path)
+    fingerprint = getAFLibraryFingerprint(yaml_file_path)
+    if offsets is None:
+        entries = list(iterAFPromptEntries(yaml_file_path))
+        count = len(entries)
+    else:
+        entries = None
+        count = len(offsets) - 1
+    if count == 0:
+        return None
+
+    rng = random.Random(seed)
+    if not weight_tags.strip() and recency_half_life <= 0:
+        index = rng.randrange(count)
+    else:
+        key = (yaml_file_path, fingerprint, weight_tags.strip().lower(), recency_half_life)
+        with _af_sampling_lock:
+            table = _af_alias_cache.get(key)
+            if table is not None:
+                _af_alias_cache.move_to_end(key)
+        if table is None:
+            table = buildAFAliasTable(getAFEntryWeights(yaml_file_path, count, weight_tags, recency_half_life))
+            with _af_sampling_lock:
+                _af_alias_cache[key] = table
+                while len(_af_alias_cache) > AF_ALIAS_CACHE_SIZE:
+                    _af_alias_cache.popitem(last=False)
+        if table is None:
+            index = rng.randrange(count)
+        else:
+            prob, alias = table
+            column = rng.randrange(count)
+            index = column if rng.random() < prob[column] else alias[column]
+
+    entry = entries[index] if entries is not None else readAFEntryAt(yaml_file_path, offsets, index)
+    return index, entry
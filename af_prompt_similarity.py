@@ -0,0 +1,234 @@
+# ****** ComfyUI_NoxinNodes_Extended | AF Prompt Similarity ******
+#
+# Creator: Alex Furer | Co-Creator(s): Claude AI | Original author: Noxin https://github.com/noxinias/ComfyUI_NoxinNodes
+#
+# LICENSE: MIT License
+#
+# v0.1.0
+#   - Hashed n-gram prompt vectors stored as a memory-mapped .npy sidecar
+#   - AF Find Similar Prompts node (top-k cosine similarity)
+#
+# Description:
+# Finds saved prompts similar to a given prompt. Every prompt is embedded as a
+# hashed vector of character 3-grams and words (no model or GPU needed). The
+# matrix lives next to the library in .af_meta/<file>.yaml.vec.npy, is appended
+# to by AFPromptSave and rebuilt lazily when the library changed elsewhere.
+#
+# Usage:
+# - Select the YAML library and connect the prompt to compare
+# - Set top_k for the number of matches to return
+
+import os
+import re
+import json
+import zlib
+import hashlib
+import threading
+from itertools import islice
+
+import numpy as np
+
+from .af_prompt_library import (findAFYAMLFile, getAFSidecarPath, getAFLibraryFingerprint,
+                                iterAFPromptEntries, writeAFSidecarAtomic)
+from .af_load_prompt_history import getAFYAMLFiles
+
+# Number of hash buckets per prompt vector (float32, so 2 KB per prompt)
+AF_VECTOR_DIM = 512
+
+_af_vector_lock = threading.Lock()
+
+def vectorizeAFPrompt(text, dim=AF_VECTOR_DIM):
+    """Embed text as an L2-normalised, signed hashed vector of char 3-grams and words"""
+    vec = np.zeros(dim, dtype=np.float32)
+    words = re.findall(r"\w+", str(text).lower())
+    if not words:
+        return vec
+
+    normalized = " " + " ".join(words) + " "
+    features = [normalized[i:i + 3] for i in range(len(normalized) - 2)]
+    features += ["w:" + word for word in words]
+    for feature in features:
+        h = zlib.crc32(feature.encode('utf-8'))
+        # Low bits pick the bucket, the top bit the sign, to cancel out collisions
+        vec[h % dim] += -1.0 if h & 0x80000000 else 1.0
+
+    norm = np.linalg.norm(vec)
+    if norm > 0:
+        vec /= norm
+    return vec
+
+def getAFVectorPaths(yaml_file_path):
+    """(matrix .npy path, state .json path) of a library's similarity index"""
+    return getAFSidecarPath(yaml_file_path, "vec.npy"), getAFSidecarPath(yaml_file_path, "vec.json")
+
+def readAFVectorState(yaml_file_path):
+    _, state_path = getAFVectorPaths(yaml_file_path)
+    try:
+        with open(state_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def writeAFVectorState(yaml_file_path, fingerprint, rows):
+    _, state_path = getAFVectorPaths(yaml_file_path)
+    writeAFSidecarAtomic(state_path, json.dumps({'fingerprint': list(fingerprint), 'rows': rows, 'dim': AF_VECTOR_DIM}))
+
+def rebuildAFVectorIndex(yaml_file_path):
+    """Rebuild the vector matrix of a library with two streaming passes"""
+    matrix_path, _ = getAFVectorPaths(yaml_file_path)
+    fingerprint = getAFLibraryFingerprint(yaml_file_path)
+    rows = sum(1 for _ in iterAFPromptEntries(yaml_file_path))
+
+    os.makedirs(os.path.dirname(matrix_path), exist_ok=True)
+    tmp_path = f"{matrix_path}.{os.getpid()}.tmp.npy"
+    matrix = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=np.float32, shape=(rows, AF_VECTOR_DIM))
+    for idx, entry in enumerate(islice(iterAFPromptEntries(yaml_file_path), rows)):
+        matrix[idx] = vectorizeAFPrompt(entry.get('text', ''))
+    matrix.flush()
+    del matrix
+    os.replace(tmp_path, matrix_path)
+
+    writeAFVectorState(yaml_file_path, fingerprint, rows)
+    return rows
+
+def appendAFVectorRow(yaml_file_path, text, fingerprint_before):
+    """Append the vector of a newly saved prompt.
+
+    Only done when the index matched the library right before the save
+    (fingerprint_before); otherwise the index is left stale and rebuilt on the
+    next query.
+    """
+    matrix_path, _ = getAFVectorPaths(yaml_file_path)
+    with _af_vector_lock:
+        state = readAFVectorState(yaml_file_path)
+        if tuple(state.get('fingerprint', ())) != tuple(fingerprint_before) or state.get('dim') != AF_VECTOR_DIM:
+            return False
+
+        rows = state['rows'] + 1
+        with open(matrix_path, 'r+b') as f:
+            np.lib.format.read_magic(f)
+            np.lib.format.read_array_header_1_0(f)
+            data_offset = f.tell()
+            # The header is padded, so growing the row count normally fits in place
+            header = {'descr': '<f4', 'fortran_order': False, 'shape': (rows, AF_VECTOR_DIM)}
+            probe = _AFHeaderProbe()
+            np.lib.format.write_array_header_1_0(probe, header)
+            if probe.size != data_offset:
+                return False
+            f.seek(0, os.SEEK_END)
+            f.write(vectorizeAFPrompt(text).astype('<f4').tobytes())
+            f.seek(0)
+            np.lib.format.write_array_header_1_0(f, header)
+
+        writeAFVectorState(yaml_file_path, getAFLibraryFingerprint(yaml_file_path), rows)
+        return True
+
+class _AFHeaderProbe:
+    """File-like object that only counts written bytes"""
+    def __init__(self):
+        self.size = 0
+    def write(self, data):
+        self.size += len(data)
+
+def loadAFVectorIndex(yaml_file_path):
+    """Memory-mapped vector matrix of a library, rebuilt first if stale"""
+    matrix_path, _ = getAFVectorPaths(yaml_file_path)
+    with _af_vector_lock:
+        state = readAFVectorState(yaml_file_path)
+        fresh = (tuple(state.get('fingerprint', ())) == tuple(getAFLibraryFingerprint(yaml_file_path))
+                 and state.get('dim') == AF_VECTOR_DIM and os.path.exists(matrix_path))
+        if not fresh:
+            rows = rebuildAFVectorIndex(yaml_file_path)
+            print(f"AF Prompt Similarity: Rebuilt vector index with {rows} prompts")
+    return np.load(matrix_path, mmap_mode='r')
+
+def findAFSimilarPrompts(yaml_file_path, text, top_k=5):
+    """Top-k (score, index, entry) by cosine similarity, best first"""
+    matrix = loadAFVectorIndex(yaml_file_path)
+    if matrix.shape[0] == 0:
+        return []
+
+    # Rows are unit vectors, so one matrix-vector product gives all cosine scores
+    scores = matrix @ vectorizeAFPrompt(text)
+    k = min(top_k, len(scores))
+    best = np.argpartition(-scores, k - 1)[:k]
+    best = best[np.argsort(-scores[best])]
+
+    # Fetch only the selected entries, stopping after the last one needed
+    wanted = {int(idx) for idx in best}
+    last = max(wanted)
+    entries = {}
+    for idx, entry in enumerate(iterAFPromptEntries(yaml_file_path)):
+        if idx in wanted:
+            entries[idx] = entry
+        if idx >= last:
+            break
+
+    return [(float(scores[idx]), int(idx), entries[int(idx)]) for idx in best if int(idx) in entries]
+
+class AFPromptSimilar:
+    """Finds saved prompts similar to the given prompt"""
+
+    @classmethod
+    def INPUT_TYPES(s):
+        yaml_files = getAFYAMLFiles()
+        default_file = yaml_files[0] if yaml_files and yaml_files[0] != "No YAML files found" else ""
+
+        return {
+            "required": {
+                "prompt": ("STRING", {"default": "", "multiline": True}),
+                "filename": (yaml_files, {"default": default_file}),
+                "custom_path": ("STRING", {"default": "AF-Prompt Archive", "multiline": False}),
+                "top_k": ("INT", {"default": 5, "min": 1, "max": 100, "step": 1}),
+            }
+        }
+
+    RETURN_TYPES = ("STRING", "STRING", "FLOAT",)
+    RETURN_NAMES = ("similar_prompts", "best_prompt", "best_score",)
+
+    @classmethod
+    def IS_CHANGED(cls, prompt, filename, custom_path, top_k):
+        """Re-run when parameters or the library change"""
+        param_string = f"{prompt}:{filename}:{custom_path}:{top_k}"
+        yaml_file_path = findAFYAMLFile(filename, custom_path)
+        if yaml_file_path:
+            param_string += ":{}:{}:{}".format(*getAFLibraryFingerprint(yaml_file_path))
+        return hashlib.md5(param_string.encode()).hexdigest()
+
+    FUNCTION = "find_similar"
+    CATEGORY = "AF Nodes"
+
+    def find_similar(self, prompt, filename, custom_path, top_k):
+        if not prompt.strip() or not filename or filename == "No YAML files found":
+            return ("No results", "", 0.0)
+
+        yaml_file_path = findAFYAMLFile(filename, custom_path)
+        if not yaml_file_path:
+            return ("File not found", "", 0.0)
+
+        try:
+            matches = findAFSimilarPrompts(yaml_file_path, prompt, top_k)
+        except Exception as e:
+            return (f"Error: {str(e)}", "", 0.0)
+
+        if not matches:
+            return ("No matches found", "", 0.0)
+
+        results = []
+        for score, idx, entry in matches:
+            text = entry.get('text', '')
+            preview = text.replace('\n', ' | ')[:80]
+            if len(text) > 80:
+                preview += "..."
+            results.append(f"[{len(results)+1}] {score:.3f} {entry.get('generation_id', '')[:8]} {preview}")
+
+        return ("\n".join(results), matches[0][2].get('text', ''), matches[0][0])
+
+# Node mappings for ComfyUI
+NODE_CLASS_MAPPINGS = {
+    "AFPromptSimilar": AFPromptSimilar,
+}
+
+NODE_DISPLAY_NAME_MAPPINGS = {
+    "AFPromptSimilar": "AF Find Similar Prompts",
+}
@@ -0,0 +1,166 @@
+# ****** ComfyUI_NoxinNodes_Extended | AF Prompt Tags ******
+#
+# Creator: Alex Furer | Co-Creator(s): Claude AI | Original author: Noxin https://github.com/noxinias/ComfyUI_NoxinNodes
+#
+# LICENSE: MIT License
+#
+# v0.1.0
+#   - Tag bitmap index per library (.af_meta/<file>.yaml.tags.json)
+#   - AND/OR/NOT tag filters as bitwise operations, facet counts via popcount
+#
+# Description:
+# Every tag maps to a bitset (a Python int) with bit i set when entry i of the
+# library (file order) carries the tag. AFPromptSave sets the bits of a new
+# entry; any other change to the library rebuilds the index lazily with one
+# streaming pass.
+#
+# Filter syntax: comma separated tags, a leading "-" excludes a tag, e.g.
+# "portrait, studio, -nsfw". tag_mode "and" requires all included tags, "or" any.
+
+import json
+import threading
+
+from .af_prompt_library import (getAFSidecarPath, getAFLibraryFingerprint, iterAFPromptEntries,
+                                writeAFSidecarAtomic)
+
+_af_tag_cache = {}  # yaml_file_path -> (fingerprint, count, {tag: bits})
+_af_tag_lock = threading.Lock()
+
+def normalizeAFTag(tag):
+    return str(tag).strip().lower()
+
+def writeAFTagIndex(yaml_file_path, fingerprint, count, bitsets):
+    state = {
+        'fingerprint': list(fingerprint),
+        'count': count,
+        'tags': {tag: format(bits, 'x') for tag, bits in bitsets.items()},
+    }
+    writeAFSidecarAtomic(getAFSidecarPath(yaml_file_path, "tags.json"), json.dumps(state))
+    _af_tag_cache[yaml_file_path] = (tuple(fingerprint), count, bitsets)
+
+def readAFTagIndex(yaml_file_path):
+    """(fingerprint, count, bitsets) from the sidecar, None if missing or unreadable"""
+    cached = _af_tag_cache.get(yaml_file_path)
+    if cached is not None:
+        return cached
+    try:
+        with open(getAFSidecarPath(yaml_file_path, "tags.json"), 'r', encoding='utf-8') as f:
+            state = json.load(f)
+        bitsets = {tag: int(bits, 16) for tag, bits in state['tags'].items()}
+        return (tuple(state['fingerprint']), int(state['count']), bitsets)
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+def buildAFTagBitsets(entries):
+    """(count, {tag: bitset}) for an iterable of entries"""
+    bitsets = {}
+    count = 0
+    for idx, entry in enumerate(entries):
+        tags = entry.get('tags', []) if isinstance(entry, dict) else []
+        if isinstance(tags, list):
+            for tag in set(normalizeAFTag(t) for t in tags):
+                if tag:
+                    bitsets[tag] = bitsets.get(tag, 0) | (1 << idx)
+        count = idx + 1
+    return count, bitsets
+
+def rebuildAFTagIndex(yaml_file_path):
+    fingerprint = getAFLibraryFingerprint(yaml_file_path)
+    count, bitsets = buildAFTagBitsets(iterAFPromptEntries(yaml_file_path))
+    writeAFTagIndex(yaml_file_path, fingerprint, count, bitsets)
+    return count, bitsets
+
+def loadAFTagIndex(yaml_file_path):
+    """(entry count, {tag: bitset}) of a library, rebuilt first if stale"""
+    fingerprint = getAFLibraryFingerprint(yaml_file_path)
+    with _af_tag_lock:
+        index = readAFTagIndex(yaml_file_path)
+        if index is not None and index[0] == fingerprint:
+            _af_tag_cache[yaml_file_path] = index
+            return index[1], index[2]
+        return rebuildAFTagIndex(yaml_file_path)
+
+def appendAFTagIndex(yaml_file_path, tags, fingerprint_before):
+    """Set the bits of an entry appended by AFPromptSave.
+
+    Only done when the index matched the library right before the save,
+    otherwise it is rebuilt on next use.
+    """
+    with _af_tag_lock:
+        index = readAFTagIndex(yaml_file_path)
+        if index is None or index[0] != tuple(fingerprint_before):
+            return False
+        _, count, bitsets = index
+        bitsets = dict(bitsets)
+        for tag in set(normalizeAFTag(t) for t in (tags or [])):
+            if tag:
+                bitsets[tag] = bitsets.get(tag, 0) | (1 << count)
+        writeAFTagIndex(yaml_file_path, getAFLibraryFingerprint(yaml_file_path), count + 1, bitsets)
+        return True
+
+def parseAFTagFilter(tag_filter):
+    """Split "a, b, -c" into (['a', 'b'], ['c'])"""
+    include, exclude = [], []
+    for term in tag_filter.split(','):
+        term = term.strip()
+        if term.startswith('-') and normalizeAFTag(term[1:]):
+            exclude.append(normalizeAFTag(term[1:]))
+        elif normalizeAFTag(term):
+            include.append(normalizeAFTag(term))
+    return include, exclude
+
+def getAFTagMask(count, bitsets, tag_filter, tag_mode="and"):
+    """Bitset of entries passing the filter, None when there is no filter"""
+    include, exclude = parseAFTagFilter(tag_filter)
+    if not include and not exclude:
+        return None
+
+    all_bits = (1 << count) - 1
+    if not include:
+        mask = all_bits
+    elif tag_mode == "or":
+        mask = 0
+        for tag in include:
+            mask |= bitsets.get(tag, 0)
+    else:
+        mask = all_bits
+        for tag in include:
+            mask &= bitsets.get(tag, 0)
+    for tag in exclude:
+        mask &= ~bitsets.get(tag, 0)
+    return mask & all_bits
+
+def getAFFacetCounts(count, bitsets, mask=None):
+    """[(tag, count)] of prompts per tag within mask, most frequent first"""
+    facets = []
+    for tag, bits in bitsets.items():
+        hits = (bits & mask if mask is not None else bits).bit_count()
+        if hits:
+            facets.append((tag, hits))
+    facets.sort(key=lambda f: (-f[1], f[0]))
+    return facets
+
+def iterAFBits(bits):
+    """Indices of the set bits of a bitset, ascending"""
+    return (idx for idx, bit in enumerate(reversed(bin(bits)[2:])) if bit == '1')
+
+def formatAFFacets(facets):
+    return "\n".join(f"{tag}: {hits}" for tag, hits in facets)
+
+def getAFParsedTagMask(yaml_file_path, prompts_data, tag_filter, tag_mode="and"):
+    """(count, bitsets, mask) for the entries of a parsed library, mask is None without a filter"""
+    count, bitsets = loadAFTagIndex(yaml_file_path)
+    if count != len(prompts_data):
+        # The library changed after it was parsed, index the parsed entries instead
+        count, bitsets = buildAFTagBitsets(prompts_data)
+    return count, bitsets, getAFTagMask(count, bitsets, tag_filter, tag_mode)
+
+def applyAFTagFilter(yaml_file_path, prompts_data, tag_filter, tag_mode="and"):
+    """Keep the entries of a parsed library (file order) that pass a tag filter.
+
+    Returns (filtered entries, count, bitsets, mask).
+    """
+    count, bitsets, mask = getAFParsedTagMask(yaml_file_path, prompts_data, tag_filter, tag_mode)
+    if mask is None:
+        return prompts_data, count, bitsets, None
+    return [p for idx, p in enumerate(prompts_data) if mask >> idx & 1], count, bitsets, mask
@@ -34,6 +34,21 @@ import os
 from datetime import datetime
 import uuid
 import hashlib
+import csv
+import json
+from itertools import chain
+
+from .af_prompt_library import (bumpAFFileGeneration, getAFDropdownCacheStats, getAFLibraryPath,
+                                getAFLibraryFingerprint, iterAFPromptEntries, filterAFPromptEntries,
+                                readAFLibraryMetadata, writeAFLibraryStreamed, getAFLibraryLock, putAFBlob,
+                                collectAFBlobGarbage)
+from .af_prompt_retention import scheduleAFRetention, compactAFLibrary, writeAFRetentionPolicy, readAFRetentionPolicy
+from .af_prompt_similarity import appendAFVectorRow
+from .af_prompt_tags import appendAFTagIndex
+from .af_prompt_sampling import appendAFRecordOffset
+
+# Column order of CSV exports, other entry fields are JSONL only
+AF_CSV_FIELDS = ['timestamp', 'generation_id', 'content_hash', 'tags', 'notes', 'text']
 
 class AFPromptSave:
     def __init__(self):
@@ -54,6 +69,12 @@ class AFPromptSave:
                 "generation_id": ("STRING", {"default": "", "multiline": False}),
                 "tags": ("STRING", {"default": "", "multiline": False}),  # Optional tags for categorization
                 "notes": ("STRING", {"default": "", "multiline": False}),  # Optional notes
+                # Store the workflow and generation settings (once per unique content) and link them by hash
+                "capture_workflow": ("BOOLEAN", {"default": False}),
+            },
+            "hidden": {
+                "prompt": "PROMPT",
+                "extra_pnginfo": "EXTRA_PNGINFO",
             },
         }
 
@@ -135,7 +156,8 @@ class AFPromptSave:
         
         return None
 
-    def main(self, newprompt, filename, saveprompt, custom_path, force_save=True, generation_id="", tags="", notes=""):      
+    def main(self, newprompt, filename, saveprompt, custom_path, force_save=True, generation_id="", tags="", notes="",
+             capture_workflow=False, prompt=None, extra_pnginfo=None):      
         outStr = newprompt
         yaml_filepath = ""
         
@@ -162,76 +184,149 @@ class AFPromptSave:
             yaml_file_path = os.path.join(library_path, yaml_filename)
             yaml_filepath = yaml_file_path
             
-            try:
-                # Load existing data
-                yaml_data = self.load_existing_yaml(yaml_file_path)
-                
-                # Check for duplicates (but still save if force_save is True)
-                duplicate = self.find_duplicate_prompt(yaml_data['prompts'], newprompt, generation_id)
-                
-                if duplicate and not force_save:
-                    print(f"AF Prompt Save: Duplicate prompt found, skipping save")
-                    return (outStr, duplicate.get('generation_id', generation_id), yaml_filepath)
-                
-                # Prepare new prompt entry
-                new_prompt = {
-                    'text': newprompt,
-                    'timestamp': datetime.now().isoformat(),
-                    'generation_id': generation_id,
-                    'content_hash': hashlib.md5(newprompt.strip().encode()).hexdigest()[:8]  # Short hash for reference
-                }
-                
-                # Add optional fields if provided
-                if tags.strip():
-                    new_prompt['tags'] = [tag.strip() for tag in tags.split(',') if tag.strip()]
-                
-                if notes.strip():
-                    new_prompt['notes'] = notes.strip()
-                
-                # Add workflow info if available
+            # Hold the library lock so a background compaction cannot interleave with this save
+            with getAFLibraryLock(yaml_file_path):
                 try:
-                    new_prompt['saved_from'] = {
-                        'node_type': 'AF_Save_Prompt_History',
-                        'filename': filename,
-                        'custom_path': custom_path
+                    # Remember the library state so the similarity index can be appended to
+                    fingerprint_before = getAFLibraryFingerprint(yaml_file_path)
+                    
+                    # Load existing data
+                    yaml_data = self.load_existing_yaml(yaml_file_path)
+                    
+                    # Check for duplicates (but still save if force_save is True)
+                    duplicate = self.find_duplicate_prompt(yaml_data['prompts'], newprompt, generation_id)
+                    
+                    if duplicate and not force_save:
+                        print(f"AF Prompt Save: Duplicate prompt found, skipping save")
+                        return (outStr, duplicate.get('generation_id', generation_id), yaml_filepath)
+                    
+                    # Prepare new prompt entry
+                    new_prompt = {
+                        'text': newprompt,
+                        'timestamp': datetime.now().isoformat(),
+                        'generation_id': generation_id,
+                        'content_hash': hashlib.md5(newprompt.strip().encode()).hexdigest()[:8]  # Short hash for reference
                     }
-                except:
-                    pass
-                
-                # Add to prompts list
-                yaml_data['prompts'].append(new_prompt)
-                
-                # Update metadata
-                yaml_data['metadata']['total_prompts'] = len(yaml_data['prompts'])
-                yaml_data['metadata']['last_updated'] = datetime.now().isoformat()
-                
-                # Save YAML file with nice formatting
-                with open(yaml_file_path, 'w', encoding='utf-8') as yamlfile:
-                    yaml.dump(yaml_data, yamlfile, 
-                             default_flow_style=False, 
-                             allow_unicode=True, 
-                             indent=2, 
-                             sort_keys=False)
                     
-                print(f"AF Prompt Save: Saved prompt to {yaml_filename} with ID {generation_id}")
-                
-                # Log save stats
-                total_prompts = len(yaml_data['prompts'])
-                if duplicate:
-                    print(f"AF Prompt Save: Saved despite duplicate (force_save=True). Total prompts: {total_prompts}")
-                else:
-                    print(f"AF Prompt Save: New unique prompt saved. Total prompts: {total_prompts}")
-                
-            except Exception as e:
-                print(f"AF Prompt Save: Error saving to YAML - {str(e)}")
-                import traceback
-                traceback.print_exc()
+                    # Add optional fields if provided
+                    if tags.strip():
+                        new_prompt['tags'] = [tag.strip() for tag in tags.split(',') if tag.strip()]
+                    
+                    if notes.strip():
+                        new_prompt['notes'] = notes.strip()
+                    
+                    # Add workflow info if available
+                    try:
+                        new_prompt['saved_from'] = {
+                            'node_type': 'AF_Save_Prompt_History',
+                            'filename': filename,
+                            'custom_path': custom_path
+                        }
+                    except:
+                        pass
+                    
+                    # Only the hashes go into the entry, the blobs are stored once next to the library
+                    if capture_workflow:
+                        blobs = {}
+                        if prompt:
+                            blobs['prompt'] = putAFBlob(library_path, prompt)
+                        if extra_pnginfo:
+                            blobs['extra_pnginfo'] = putAFBlob(library_path, extra_pnginfo)
+                        if blobs:
+                            new_prompt['generation_blobs'] = blobs
+                    
+                    # Add to prompts list
+                    yaml_data['prompts'].append(new_prompt)
+                    
+                    # Update metadata
+                    yaml_data['metadata']['total_prompts'] = len(yaml_data['prompts'])
+                    yaml_data['metadata']['last_updated'] = datetime.now().isoformat()
+                    
+                    # Save YAML file with nice formatting
+                    with open(yaml_file_path, 'w', encoding='utf-8') as yamlfile:
+                        yaml.dump(yaml_data, yamlfile, 
+                                 default_flow_style=False, 
+                                 allow_unicode=True, 
+                                 indent=2, 
+                                 sort_keys=False)
+                    
+                    # Invalidate cached dropdowns of this file
+                    bumpAFFileGeneration(yaml_file_path)
+                    
+                    # Keep the similarity index in sync, a failure only means a rebuild on next query
+                    try:
+                        appendAFVectorRow(yaml_file_path, newprompt, fingerprint_before)
+                    except Exception as e:
+                        print(f"AF Prompt Save: Could not update similarity index - {str(e)}")
+                    try:
+                        appendAFTagIndex(yaml_file_path, new_prompt.get('tags', []), fingerprint_before)
+                    except Exception as e:
+                        print(f"AF Prompt Save: Could not update tag index - {str(e)}")
+                    try:
+                        appendAFRecordOffset(yaml_file_path, new_prompt, fingerprint_before)
+                    except Exception as e:
+                        print(f"AF Prompt Save: Could not update record offsets - {str(e)}")
+                        
+                    print(f"AF Prompt Save: Saved prompt to {yaml_filename} with ID {generation_id}")
+                    
+                    # Log save stats
+                    total_prompts = len(yaml_data['prompts'])
+                    if duplicate:
+                        print(f"AF Prompt Save: Saved despite duplicate (force_save=True). Total prompts: {total_prompts}")
+                    else:
+                        print(f"AF Prompt Save: New unique prompt saved. Total prompts: {total_prompts}")
+                    
+                    # Retention runs as a background compaction, only once the library is over its policy
+                    scheduleAFRetention(yaml_file_path, total_prompts, new_prompt)
+                    
+                except Exception as e:
+                    print(f"AF Prompt Save: Error saving to YAML - {str(e)}")
+                    import traceback
+                    traceback.print_exc()
         
         elif saveprompt == "on":
             print(f"AF Prompt Save: Skipping save - no changes detected or empty prompt")
                 
         return (outStr, generation_id, yaml_filepath)
 
+def readAFJSONLEntries(jsonl_path):
+    """Yield entries of a JSONL file line by line"""
+    with open(jsonl_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+def readAFCSVEntries(csv_path):
+    """Yield entries of a CSV export row by row"""
+    with open(csv_path, 'r', encoding='utf-8', newline='') as f:
+        for row in csv.DictReader(f):
+            yield row
+
+def normalizeAFImportedEntries(entries, counter):
+    """Bring imported rows into the shape AFPromptSave writes, skipping rows without text"""
+    for entry in entries:
+        if not isinstance(entry, dict) or not str(entry.get('text') or '').strip():
+            continue
+        text = str(entry['text'])
+        new_prompt = {
+            'text': text,
+            'timestamp': str(entry.get('timestamp') or datetime.now().isoformat()),
+            'generation_id': str(entry.get('generation_id') or str(uuid.uuid4())[:8]),
+            'content_hash': str(entry.get('content_hash') or hashlib.md5(text.strip().encode()).hexdigest()[:8]),
+        }
+        tags = entry.get('tags')
+        if isinstance(tags, str):
+            tags = [tag.strip() for tag in tags.split(',') if tag.strip()]
+        if tags:
+            new_prompt['tags'] = list(tags)
+        if entry.get('notes'):
+            new_prompt['notes'] = str(entry['notes'])
+        for key, value in entry.items():
+            if key not in new_prompt and key not in ('tags', 'notes') and value not in (None, ''):
+                new_prompt[key] = value
+        counter['imported'] += 1
+        yield new_prompt
+
 # Also provide a utility node for YAML management
 class AFPromptYAMLManager:
     """Utility node for managing YAML prompt files"""
@@ -240,12 +335,23 @@ class AFPromptYAMLManager:
     def INPUT_TYPES(s):
         return {
             "required": {
-                "action": (["merge_files", "deduplicate", "backup", "stats"], {"default": "stats"}),
+                "action": (["merge_files", "deduplicate", "backup", "stats", "export_jsonl", "export_csv", "import_entries", "set_retention", "compact", "collect_blobs"], {"default": "stats"}),
                 "filename": ("STRING", {"default": "Global_Positive", "multiline": False}),
                 "custom_path": ("STRING", {"default": "AF-Prompt Archive", "multiline": False}),
             },
             "optional": {
                 "merge_target": ("STRING", {"default": "", "multiline": False}),
+                # Export destination / import source (.jsonl or .csv), blank exports next to the library
+                "transfer_path": ("STRING", {"default": "", "multiline": False}),
+                # Optional export filters: ISO time range (inclusive) and a single tag
+                "since": ("STRING", {"default": "", "multiline": False}),
+                "until": ("STRING", {"default": "", "multiline": False}),
+                "tag_filter": ("STRING", {"default": "", "multiline": False}),
+                # Retention policy stored by set_retention (0 = no limit), keep_tags "*" keeps all tagged prompts
+                "retention_max_entries": ("INT", {"default": 0, "min": 0, "max": 10000000}),
+                "retention_max_age_days": ("INT", {"default": 0, "min": 0, "max": 36500}),
+                "retention_keep_tags": ("STRING", {"default": "", "multiline": False}),
+                "retention_archive": ("BOOLEAN", {"default": True}),
             },
         }
 
@@ -256,21 +362,43 @@ class AFPromptYAMLManager:
     OUTPUT_NODE = True
     CATEGORY = "AF Nodes"
 
-    def manage_yaml(self, action, filename, custom_path, merge_target=""):
-        try:
-            import folder_paths
-            output_dir = folder_paths.get_output_directory()
-        except:
-            my_dir = os.path.dirname(os.path.abspath(__file__))
-            comfyui_root = os.path.dirname(os.path.dirname(my_dir))
-            output_dir = os.path.join(comfyui_root, "output")
-        
-        library_path = os.path.join(output_dir, custom_path.strip())
+    def manage_yaml(self, action, filename, custom_path, merge_target="", transfer_path="", since="", until="", tag_filter="",
+                    retention_max_entries=0, retention_max_age_days=0, retention_keep_tags="", retention_archive=True):
+        library_path = getAFLibraryPath(custom_path)
         yaml_file_path = os.path.join(library_path, filename + ".yaml")
         
+        # Streaming actions never load the whole library
+        if action == "import_entries":
+            return self.import_entries(yaml_file_path, transfer_path)
+        
         if not os.path.exists(yaml_file_path):
             return ("Error", f"File {filename}.yaml not found")
         
+        if action in ("export_jsonl", "export_csv"):
+            return self.export_entries(yaml_file_path, filename, library_path, action[len("export_"):], transfer_path, since, until, tag_filter)
+        
+        if action == "set_retention":
+            try:
+                policy = writeAFRetentionPolicy(yaml_file_path, retention_max_entries, retention_max_age_days,
+                                                retention_keep_tags, retention_archive)
+            except Exception as e:
+                return ("Error", str(e))
+            return ("Retention Set", yaml.dump(policy, default_flow_style=False))
+        
+        if action == "compact":
+            try:
+                pruned = compactAFLibrary(yaml_file_path)
+            except Exception as e:
+                return ("Error", str(e))
+            return ("Compacted", f"Pruned {pruned} prompts")
+        
+        if action == "collect_blobs":
+            try:
+                removed, freed = collectAFBlobGarbage(library_path)
+            except Exception as e:
+                return ("Error", str(e))
+            return ("Blobs Collected", f"Removed {removed} unreferenced blobs ({freed / 1024:.1f} KB)")
+        
         try:
             with open(yaml_file_path, 'r', encoding='utf-8') as f:
                 data = yaml.safe_load(f) or {}
@@ -285,7 +413,10 @@ class AFPromptYAMLManager:
                     'last_updated': metadata.get('last_updated', 'Unknown'),
                     'unique_generation_ids': len(set(p.get('generation_id', '') for p in prompts)),
                     'tagged_prompts': len([p for p in prompts if p.get('tags')]),
-                    'prompts_with_notes': len([p for p in prompts if p.get('notes')])
+                    'prompts_with_notes': len([p for p in prompts if p.get('notes')]),
+                    'last_compacted': metadata.get('last_compacted', 'Never'),
+                    'retention': readAFRetentionPolicy(yaml_file_path) or 'None',
+                    'dropdown_cache': getAFDropdownCacheStats()
                 }
                 
                 details = yaml.dump(stats, default_flow_style=False)
@@ -309,6 +440,9 @@ class AFPromptYAMLManager:
                 
                 with open(yaml_file_path, 'w', encoding='utf-8') as f:
                     yaml.dump(data, f, default_flow_style=False, allow_unicode=True, indent=2)
+                bumpAFFileGeneration(yaml_file_path)
+                if removed:
+                    collectAFBlobGarbage(library_path)
                 
                 return ("Deduplicated", f"Removed {removed} duplicate prompts")
             
@@ -327,6 +461,60 @@ class AFPromptYAMLManager:
         except Exception as e:
             return ("Error", str(e))
 
+    def export_entries(self, yaml_file_path, filename, library_path, export_format, transfer_path, since, until, tag_filter):
+        """Stream (optionally filtered) entries to a JSONL or CSV file"""
+        if not transfer_path.strip():
+            transfer_path = os.path.join(library_path, f"{filename}_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{export_format}")
+        
+        entries = filterAFPromptEntries(iterAFPromptEntries(yaml_file_path), since, until, tag_filter)
+        count = 0
+        try:
+            if export_format == "jsonl":
+                with open(transfer_path, 'w', encoding='utf-8') as f:
+                    for entry in entries:
+                        f.write(json.dumps(entry, ensure_ascii=False, default=str) + "\n")
+                        count += 1
+            else:
+                with open(transfer_path, 'w', encoding='utf-8', newline='') as f:
+                    writer = csv.DictWriter(f, fieldnames=AF_CSV_FIELDS, extrasaction='ignore')
+                    writer.writeheader()
+                    for entry in entries:
+                        row = dict(entry)
+                        tags = row.get('tags', [])
+                        row['tags'] = ", ".join(str(t) for t in tags) if isinstance(tags, list) else str(tags or "")
+                        writer.writerow(row)
+                        count += 1
+        except Exception as e:
+            return ("Error", str(e))
+        
+        return ("Exported", f"Exported {count} prompts to {transfer_path}")
+
+    def import_entries(self, yaml_file_path, transfer_path):
+        """Stream JSONL or CSV entries into a library without building a list first"""
+        if not transfer_path.strip() or not os.path.exists(transfer_path):
+            return ("Error", f"Import file {transfer_path} not found")
+        
+        if transfer_path.lower().endswith('.csv'):
+            imported = readAFCSVEntries(transfer_path)
+        else:
+            imported = readAFJSONLEntries(transfer_path)
+        
+        try:
+            if os.path.exists(yaml_file_path):
+                metadata = readAFLibraryMetadata(yaml_file_path)
+                existing = iterAFPromptEntries(yaml_file_path)
+            else:
+                metadata = {'created': datetime.now().isoformat(), 'file_version': '1.0'}
+                existing = iter(())
+            
+            counter = {'imported': 0}
+            with getAFLibraryLock(yaml_file_path):
+                total = writeAFLibraryStreamed(yaml_file_path, metadata, chain(existing, normalizeAFImportedEntries(imported, counter)))
+        except Exception as e:
+            return ("Error", str(e))
+        
+        return ("Imported", f"Imported {counter['imported']} prompts. Total prompts: {total}")
+
 # Node mappings for ComfyUI
 NODE_CLASS_MAPPINGS = {
     "AFPromptSave": AFPromptSave,
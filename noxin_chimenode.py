@@ -1,35 +1,203 @@
+import os
+import platform
+import shlex
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Commands run on a small shared pool so a burst of executions can't fork-bomb the host
+CHIME_MAX_WORKERS = 2
+CHIME_MAX_PENDING = 8
+
+class NoxinCommandRunner:
+    """Runs chime/post-execution commands in the background.
+
+    At most CHIME_MAX_WORKERS commands run at once and at most CHIME_MAX_PENDING
+    are queued or running; anything beyond that is skipped instead of queued.
+    """
+
+    def __init__(self, max_workers=CHIME_MAX_WORKERS, max_pending=CHIME_MAX_PENDING):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="NoxinChime")
+        self.slots = threading.BoundedSemaphore(max_pending)
+        self.lock = threading.Lock()
+        self.lastExitStatus = -1
+        self.lastStatus = "idle"
+        self.skipped = 0
+
+    def submit(self, command, timeout):
+        """Queue a command, returns False if the runner is saturated"""
+        if not self.slots.acquire(blocking=False):
+            with self.lock:
+                self.skipped += 1
+            return False
+        try:
+            self.executor.submit(self._run, command, timeout)
+        except Exception:
+            self.slots.release()
+            raise
+        return True
+
+    def status(self):
+        with self.lock:
+            return self.lastExitStatus, self.lastStatus
+
+    def _run(self, command, timeout):
+        try:
+            if callable(command):
+                command()
+                exitStatus, status = 0, "exit 0"
+            else:
+                completed = subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                                           timeout=timeout if timeout > 0 else None)
+                exitStatus, status = completed.returncode, "exit " + str(completed.returncode)
+        except subprocess.TimeoutExpired:
+            # subprocess.run kills the child before raising
+            exitStatus, status = -1, "timeout after " + str(timeout) + "s"
+        except Exception as e:
+            exitStatus, status = -1, "error: " + str(e)
+        finally:
+            self.slots.release()
+
+        with self.lock:
+            self.lastExitStatus = exitStatus
+            self.lastStatus = status
+        print("Noxin Chime: " + status)
+
+_chimeRunner = None
+_chimeRunnerLock = threading.Lock()
+
+def getChimeRunner():
+    global _chimeRunner
+    with _chimeRunnerLock:
+        if _chimeRunner is None:
+            _chimeRunner = NoxinCommandRunner()
+        return _chimeRunner
+
+def buildChimeCommand(soundPath, command):
+    """Build the argument list, command line or callable for the external command"""
+    if command.strip():
+        if platform.system() == 'Windows':
+            # CreateProcess parses the command line itself, splitting it would double-quote the tokens
+            return command.strip()
+        return shlex.split(command)
+    if platform.system() == 'Darwin':       # macOS
+        return ['open', soundPath]
+    elif platform.system() == 'Windows':    # Windows
+        return lambda: os.startfile(soundPath)
+    else:                                   # linux variants
+        return ['xdg-open', soundPath]
+
+def getQueueRemaining():
+    """Number of prompts queued or running in ComfyUI, None outside of ComfyUI"""
+    try:
+        from server import PromptServer
+        return PromptServer.instance.prompt_queue.get_tasks_remaining()
+    except Exception:
+        return None
+
+class NoxinChimeCoalescer:
+    """Collapses bursts of chime triggers into a single command.
+
+    Every trigger (re)starts a quiet period timer; the command only runs once no
+    further trigger arrived for quietPeriod seconds. In perQueue mode the timer
+    also keeps waiting until the ComfyUI queue is empty.
+    """
+
+    def __init__(self, runner):
+        self.runner = runner
+        self.lock = threading.Lock()
+        self.pending = {}  # command key -> threading.Timer
+        self.suppressed = {}  # command key -> triggers collapsed into the current burst
+
+    def trigger(self, command, timeout, quietPeriod, perQueue):
+        """Schedule command, returns the number of triggers suppressed so far in this burst"""
+        key = repr(command) if not callable(command) else "startfile"
+        with self.lock:
+            timer = self.pending.get(key)
+            if timer is not None:
+                timer.cancel()
+                self.suppressed[key] = self.suppressed.get(key, 0) + 1
+            self._schedule(key, command, timeout, quietPeriod, perQueue)
+            return self.suppressed.get(key, 0)
+
+    def _schedule(self, key, command, timeout, quietPeriod, perQueue):
+        # Caller must hold the lock
+        timer = threading.Timer(quietPeriod, self._fire, (key, command, timeout, quietPeriod, perQueue))
+        timer.daemon = True
+        self.pending[key] = timer
+        timer.start()
+
+    def _fire(self, key, command, timeout, quietPeriod, perQueue):
+        with self.lock:
+            if self.pending.get(key) is not threading.current_thread():
+                return  # superseded by a newer trigger
+            if perQueue and getQueueRemaining():
+                self._schedule(key, command, timeout, quietPeriod, perQueue)
+                return
+            del self.pending[key]
+            # The burst is over, the next trigger starts counting again
+            self.suppressed.pop(key, None)
+        self.runner.submit(command, timeout)
+
+_chimeCoalescer = None
+
+def getChimeCoalescer():
+    global _chimeCoalescer
+    runner = getChimeRunner()
+    with _chimeRunnerLock:
+        if _chimeCoalescer is None:
+            _chimeCoalescer = NoxinChimeCoalescer(runner)
+        return _chimeCoalescer
+
 class NoxinChime:
     def __init__(self):
         pass
-    
+
     @classmethod
     def INPUT_TYPES(s):
-    
+
         return {
             "required": {
                 "image": ("IMAGE",),
                 "playsound": (["enable", "disable"],),
                 "soundPath": ("STRING", {
                     "multiline": False,
-                    "default": 'C:\Windows\Media\chimes.wav'
+                    "default": 'C:\\Windows\\Media\\chimes.wav'
                 }),
             },
+            "optional": {
+                # Run this command instead of playing soundPath, e.g. a sorting or upscaling script
+                "command": ("STRING", {"default": "", "multiline": False}),
+                "timeout": ("FLOAT", {"default": 60.0, "min": 0.0, "max": 86400.0, "step": 1.0}),
+                # every: fire on each execution, debounce: once per quiet period, once_per_queue: when the queue is empty
+                "trigger_mode": (["every", "debounce", "once_per_queue"], {"default": "every"}),
+                "quiet_period": ("FLOAT", {"default": 5.0, "min": 0.1, "max": 3600.0, "step": 0.5}),
+            },
         }
 
-    RETURN_TYPES = ("IMAGE",)
-    
+    RETURN_TYPES = ("IMAGE", "INT", "STRING", "INT",)
+    RETURN_NAMES = ("IMAGE", "last_exit_status", "status", "suppressed",)
+
     FUNCTION = "main"
     CATEGORY = "NoxinNodes"
 
-    def main(self, image, playsound, soundPath):
-        if playsound == "enable": 
-        
-            import subprocess, os, platform
-            if platform.system() == 'Darwin':       # macOS
-                subprocess.call(('open', soundPath))
-            elif platform.system() == 'Windows':    # Windows
-                os.startfile(soundPath)
-            else:                                   # linux variants
-                subprocess.call(('xdg-open', soundPath))
-        
-        return (image,)
+    def main(self, image, playsound, soundPath, command="", timeout=60.0, trigger_mode="every", quiet_period=5.0):
+        runner = getChimeRunner()
+        coalescer = getChimeCoalescer()
+
+        suppressed = 0
+        if playsound == "enable" and trigger_mode != "every":
+            suppressed = coalescer.trigger(buildChimeCommand(soundPath, command), timeout, quiet_period, trigger_mode == "once_per_queue")
+            state = "scheduled"
+        elif playsound == "enable":
+            if runner.submit(buildChimeCommand(soundPath, command), timeout):
+                state = "queued"
+            else:
+                state = "skipped (runner busy)"
+        else:
+            state = "disabled"
+
+        # Exit status of the most recently finished command, -1 if none finished yet
+        lastExitStatus, lastStatus = runner.status()
+        # image is passed through untouched, no copy
+        return (image, lastExitStatus, state + ", last: " + lastStatus, suppressed)
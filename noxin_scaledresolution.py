@@ -1,3 +1,5 @@
+import math
+
 class NoxinScaledResolution:
 
     def __init__(self):
@@ -37,4 +39,102 @@ class NoxinScaledResolution:
         finalHeight = int(targetHeight * UPSCALEFACTOR)
         
         print("Running scaled node")
-        return (finalWidth,finalHeight,targetWidth,targetHeight, UPSCALEFACTOR)
\ No newline at end of file
+        return (finalWidth,finalHeight,targetWidth,targetHeight, UPSCALEFACTOR)
+
+# Base training resolution (long side of a square) per model family
+plannerBaseSides = {"SD15": 512, "SDXL": 1024}
+plannerSnaps = (8, 64)
+# Aspect ratio lookup resolution: one table slot per 1/128 of a doubling of w/h, up to 4:1
+aspectSteps = 128
+aspectMaxLog2 = 2
+
+def buildBuckets(baseSide, snap):
+    """All (width, height) pairs snapped to snap with roughly baseSide^2 pixels"""
+    area = baseSide * baseSide
+    buckets = set()
+    for width in range(baseSide // 2 - baseSide // 2 % snap, baseSide * 2 + 1, snap):
+        if width <= 0:
+            continue
+        height = max(snap, int(round(area / width / snap)) * snap)
+        ratio = width / height
+        if 1 / 2 ** aspectMaxLog2 <= ratio <= 2 ** aspectMaxLog2:
+            buckets.add((width, height))
+    return sorted(buckets)
+
+def buildBucketTable(baseSide, snap):
+    """Precompute the nearest bucket for every quantized aspect ratio slot"""
+    buckets = buildBuckets(baseSide, snap)
+    table = []
+    for slot in range(-aspectMaxLog2 * aspectSteps, aspectMaxLog2 * aspectSteps + 1):
+        target = slot / aspectSteps
+        table.append(min(buckets, key=lambda b: (abs(math.log2(b[0] / b[1]) - target), -b[0] * b[1])))
+    return table
+
+# (model, snap) -> bucket per aspect slot, built once at import
+bucketTables = {(model, snap): buildBucketTable(side, snap) for model, side in plannerBaseSides.items() for snap in plannerSnaps}
+
+def lookupBucket(width, height, model, snap):
+    """O(1) nearest aspect-ratio bucket for width x height"""
+    slot = int(round(math.log2(max(width, 1) / max(height, 1)) * aspectSteps))
+    slot = min(max(slot, -aspectMaxLog2 * aspectSteps), aspectMaxLog2 * aspectSteps)
+    return bucketTables[(model, snap)][slot + aspectMaxLog2 * aspectSteps]
+
+def snapTo(value, snap):
+    return max(snap, int(round(value / snap)) * snap)
+
+class NoxinResolutionPlanner:
+    """Picks a model-friendly resolution bucket and estimates tensor memory to size the batch"""
+
+    def __init__(self):
+        pass
+
+    @classmethod
+    def INPUT_TYPES(s):
+
+        return {
+            "required": {
+                "WIDTH": ("INT", {"default": 1024, "min": 64, "max": 16384}),
+                "HEIGHT": ("INT", {"default": 1024, "min": 64, "max": 16384}),
+                "MODEL": (list(plannerBaseSides.keys()), {"default": "SDXL"}),
+                "SNAP": (["64", "8"], {"default": "64"}),
+                "UPSCALEFACTOR": ("FLOAT", {"round": "False", "default": 2.0}),
+                "MEMORY_BUDGET_MB": ("INT", {"default": 4096, "min": 1, "max": 1048576}),
+                "LATENT_CHANNELS": ("INT", {"default": 4, "min": 1, "max": 128}),
+                "PRECISION": (["fp16", "fp32"], {"default": "fp16"}),
+                # Multiplier on top of the raw tensors for UNet/VAE activations and working memory,
+                # 8 is a conservative fit for SD1.5/SDXL sampling plus VAE decode (model weights not included)
+                "OVERHEAD_FACTOR": ("FLOAT", {"default": 8.0, "min": 1.0, "max": 1000.0, "step": 0.5}),
+                "MAX_BATCH": ("INT", {"default": 64, "min": 1, "max": 4096}),
+            },
+        }
+
+    RETURN_TYPES = ("INT","INT","INT","INT","INT","FLOAT","FLOAT","STRING")
+    RETURN_NAMES = ("WIDTH","HEIGHT","UPSCALED_WIDTH","UPSCALED_HEIGHT","BATCH_SIZE","LATENT_MB","PIXEL_MB","INFO")
+
+    FUNCTION = "main"
+    CATEGORY = "NoxinNodes"
+
+    def main(self, WIDTH, HEIGHT, MODEL, SNAP, UPSCALEFACTOR, MEMORY_BUDGET_MB, LATENT_CHANNELS, PRECISION, OVERHEAD_FACTOR, MAX_BATCH):
+        snap = int(SNAP)
+        bucketWidth, bucketHeight = lookupBucket(WIDTH, HEIGHT, MODEL, snap)
+        upscaledWidth = snapTo(bucketWidth * UPSCALEFACTOR, snap)
+        upscaledHeight = snapTo(bucketHeight * UPSCALEFACTOR, snap)
+
+        # Latents are 1/8 of the pixel size, IMAGE tensors are float32 RGB
+        latentBytes = LATENT_CHANNELS * (bucketWidth // 8) * (bucketHeight // 8) * (2 if PRECISION == "fp16" else 4)
+        pixelBytes = 3 * 4 * (bucketWidth * bucketHeight + upscaledWidth * upscaledHeight)
+        perImageBytes = (latentBytes + pixelBytes) * OVERHEAD_FACTOR
+
+        batchSize = int(MEMORY_BUDGET_MB * 1024 * 1024 // perImageBytes)
+        fits = batchSize >= 1
+        batchSize = min(max(batchSize, 1), MAX_BATCH)
+
+        latentMB = latentBytes / (1024 * 1024)
+        pixelMB = pixelBytes / (1024 * 1024)
+        info = "%dx%d (%s, /%d) -> %dx%d, %.2f MB latent + %.2f MB pixels per image, x%.1f overhead = %.0f MB, batch %d for %d MB (model weights excluded)" % (
+            bucketWidth, bucketHeight, MODEL, snap, upscaledWidth, upscaledHeight, latentMB, pixelMB, OVERHEAD_FACTOR,
+            perImageBytes / (1024 * 1024), batchSize, MEMORY_BUDGET_MB)
+        if not fits:
+            info += " - WARNING: does not fit, a single image needs more than the budget"
+        print("Resolution planner: " + info)
+        return (bucketWidth, bucketHeight, upscaledWidth, upscaledHeight, batchSize, latentMB, pixelMB, info)
@@ -1,3 +1,8 @@
+import ast
+from functools import lru_cache, reduce
+
+import numpy as np
+
 class NoxinSimpleMath:
 
     def __init__(self):
@@ -58,4 +63,122 @@ class NoxinSimpleMath:
         finalInt = int(result)
         finalFloat = float(result)
         finalString = str(result)       
-        return (finalInt, finalFloat,finalString)
\ No newline at end of file
+        return (finalInt, finalFloat,finalString)
+
+def elementwiseReduce(function, name):
+    """Variadic min/max: min(a, b, c) folds the binary numpy function over its arguments"""
+    def reduced(*values):
+        if not values:
+            raise ValueError(name + "() needs at least one argument")
+        return reduce(function, values)
+    return reduced
+
+# Functions and constants usable inside NoxinMathExpression formulas, all element-wise
+expressionFunctions = {
+    "abs": np.abs, "min": elementwiseReduce(np.minimum, "min"), "max": elementwiseReduce(np.maximum, "max"), "clip": np.clip, "where": np.where,
+    "sqrt": np.sqrt, "exp": np.exp, "log": np.log, "sin": np.sin, "cos": np.cos, "tan": np.tan,
+    "floor": np.floor, "ceil": np.ceil, "round": np.round,
+    "pi": np.pi, "e": np.e,
+}
+expressionVariables = ("a", "b", "c", "d", "i", "t", "n")
+
+allowedNodes = (
+    ast.Expression, ast.BinOp, ast.UnaryOp, ast.Compare, ast.Call, ast.Name, ast.Load, ast.Constant,
+    ast.Add, ast.Sub, ast.Mult, ast.Div, ast.FloorDiv, ast.Mod, ast.Pow, ast.USub, ast.UAdd,
+    ast.BitAnd, ast.BitOr, ast.Invert,
+    ast.Lt, ast.LtE, ast.Gt, ast.GtE, ast.Eq, ast.NotEq,
+)
+
+@lru_cache(maxsize=128)
+def compileExpression(expression):
+    """Parse a formula once into a validated, compiled code object.
+
+    Only arithmetic, comparisons, the variables a, b, c, d, i, t, n and the
+    functions in expressionFunctions are allowed. Literals become numpy floats,
+    so e.g. 9**9**9 overflows right away instead of building a huge int and
+    1 / 0 gives inf like every other element-wise division.
+    """
+    tree = ast.parse(expression.strip(), mode="eval")
+    for node in ast.walk(tree):
+        if not isinstance(node, allowedNodes):
+            raise ValueError("unsupported syntax: " + type(node).__name__)
+        if isinstance(node, ast.Name) and node.id not in expressionVariables and node.id not in expressionFunctions:
+            raise ValueError("unknown name: " + node.id)
+        if isinstance(node, ast.Call) and (not isinstance(node.func, ast.Name) or node.keywords):
+            raise ValueError("only plain calls of the builtin functions are allowed")
+        if isinstance(node, ast.Constant):
+            if isinstance(node.value, bool) or not isinstance(node.value, (int, float)):
+                raise ValueError("only numeric constants are allowed")
+            node.value = float(node.value)
+    tree = ast.fix_missing_locations(NumpyConstants().visit(tree))
+    return compile(tree, "<expression>", "eval")
+
+class NumpyConstants(ast.NodeTransformer):
+    """Wrap numeric literals in a numpy float call, as plain floats ignore np.errstate"""
+
+    def visit_Constant(self, node):
+        return ast.copy_location(ast.Call(func=ast.Name(id="_float64", ctx=ast.Load()), args=[node], keywords=[]), node)
+
+def parseValues(text):
+    """Parse "1.5" into a numpy scalar and "1, 2, 3" into an array.
+
+    Scalars are numpy floats too, so e.g. a / 0 gives inf like it does for lists.
+    """
+    text = text.strip().strip("[]")
+    if text == "":
+        return np.float64(0.0)
+    values = [float(v) for v in text.replace(";", ",").split(",") if v.strip() != ""]
+    return np.float64(values[0]) if len(values) == 1 else np.asarray(values, dtype=np.float64)
+
+def evaluateExpression(expression, variables):
+    """Evaluate a cached formula element-wise over scalars or arrays, returns a 1-D array"""
+    namespace = dict(expressionFunctions)
+    namespace.update(variables)
+    namespace["_float64"] = np.float64
+    with np.errstate(all="ignore"):
+        result = eval(compileExpression(expression), {"__builtins__": {}}, namespace)
+    return np.atleast_1d(np.asarray(result, dtype=np.float64))
+
+class NoxinMathExpression:
+    """Evaluates a formula over named inputs, element-wise over lists (e.g. per-step CFG ramps)"""
+
+    def __init__(self):
+        pass
+
+    @classmethod
+    def INPUT_TYPES(s):
+
+        return {
+            "required": {
+                "EXPRESSION": ("STRING", {"default": "a + (b - a) * t", "multiline": False}),
+                # Each value is a number or a comma separated list, lists are evaluated element-wise
+                "a": ("STRING", {"default": "0", "multiline": False}),
+                "b": ("STRING", {"default": "0", "multiline": False}),
+                "c": ("STRING", {"default": "0", "multiline": False}),
+                "d": ("STRING", {"default": "0", "multiline": False}),
+                # steps > 1 provides i = 0..steps-1 and t = 0..1 for schedules, n = steps
+                "STEPS": ("INT", {"default": 1, "min": 1, "max": 10000, "step": 1, "display": "number"}),
+            },
+        }
+
+    RETURN_TYPES = ("FLOAT","INT","STRING")
+    RETURN_NAMES = ("FLOAT","INT","STRING")
+    OUTPUT_IS_LIST = (True, True, False)
+
+    FUNCTION = "main"
+    CATEGORY = "NoxinNodes"
+
+    def main(self, EXPRESSION, a, b, c, d, STEPS):
+        variables = {
+            "a": parseValues(a), "b": parseValues(b), "c": parseValues(c), "d": parseValues(d),
+            "i": np.arange(STEPS, dtype=np.float64) if STEPS > 1 else np.float64(0.0),
+            "t": np.linspace(0.0, 1.0, STEPS) if STEPS > 1 else np.float64(0.0),
+            "n": np.float64(STEPS),
+        }
+        result = evaluateExpression(EXPRESSION, variables)
+
+        finalFloats = result.tolist()
+        # inf/nan and huge values are clamped so INT consumers get a valid 64-bit integer
+        finalInts = [int(v) for v in np.clip(np.nan_to_num(result), -2.0 ** 63, np.nextafter(2.0 ** 63, 0))]
+        finalString = ", ".join(str(v) for v in finalFloats)
+        return (finalFloats, finalInts, finalString)
@@ -1,10 +1,143 @@
+import math
+import random
+import re
+from functools import lru_cache
+
+# One template item: optional <separator> followed by a section name, e.g. "<, in >setting".
+# The separator is matched as a whole so it may contain commas; empty items are skipped
+templateItemPattern = re.compile(r'\s*(?:<([^>]*)>)?\s*([A-Za-z0-9_]+)\s*(?:,|$)|\s*,|\s+$')
+
+@lru_cache(maxsize=64)
+def compileTemplate(orderstring):
+    """Compile an order/template string into a tuple of (sectionName, separator).
+
+    Items are comma separated section names. A section may be prefixed with its
+    own separator in angle brackets, "<, in >setting", which replaces the node
+    delimiter in front of it. Separators are conditional: they are only emitted
+    between two non-empty sections.
+    """
+    items = []
+    position = 0
+    while position < len(orderstring):
+        match = templateItemPattern.match(orderstring, position)
+        if not match:
+            raise ValueError("Split Prompt: invalid template item '" + orderstring[position:].split(",")[0].strip() + "'")
+        if match.group(2):
+            items.append((match.group(2).lower(), match.group(1)))
+        position = match.end()
+    return tuple(items)
+
+@lru_cache(maxsize=64)
+def parseExtraSections(extraSections):
+    """Parse "name: value" lines into a dict of additional sections"""
+    sections = {}
+    for line in extraSections.splitlines():
+        name, sep, value = line.partition(":")
+        if sep and name.strip():
+            sections[name.strip().lower()] = value.strip()
+    return sections
+
+def dedupeTokens(text, delim, seen):
+    """Drop tokens of text (split by delim) that were already used, case-insensitive"""
+    splitOn = delim if delim.strip() else ","
+    kept = []
+    for token in text.split(splitOn):
+        key = token.strip().lower()
+        if key == "" or key in seen:
+            continue
+        seen.add(key)
+        kept.append(token.strip() if not kept else token)
+    return splitOn.join(kept)
+
+def renderTemplate(template, sections, delim, dedupe=False):
+    """Assemble the sections of a compiled template with a single join"""
+    parts = []
+    seen = set()
+    for sectionName, separator in template:
+        sectionData = sections.get(sectionName, "")
+        if dedupe and sectionData != "":
+            sectionData = dedupeTokens(sectionData, delim, seen)
+        if sectionData == "":
+            continue
+        if parts:
+            parts.append(delim if separator is None else separator)
+        parts.append(sectionData)
+    return "".join(parts)
+
+sectionNames = ["loraword", "subject", "clothing", "setting", "photography", "face", "default_positive", "specific_negative", "default_negative"]
+
+def buildSections(sectionValues, extraSections=""):
+    """Map section names to their values, the fixed sections win over extra ones"""
+    sections = dict(parseExtraSections(extraSections))
+    sections.update(zip(sectionNames, sectionValues))
+    return sections
+
+def splitAlternatives(text, separator):
+    """Split a section into its alternatives, an empty section has one empty alternative"""
+    if not separator:
+        return [text]
+    alternatives = [alt.strip() for alt in text.split(separator)]
+    return [alt for alt in alternatives if alt != ""] or [""]
+
+feistelRounds = 4
+
+def feistelRound(value, key, mask):
+    """Round function of the sweep shuffle, a 64-bit integer mixer"""
+    value = (value * 0x9E3779B97F4A7C15 + key) & 0xFFFFFFFFFFFFFFFF
+    value ^= value >> 31
+    value = (value * 0xBF58476D1CE4E5B9) & 0xFFFFFFFFFFFFFFFF
+    value ^= value >> 29
+    return value & mask
+
+def shuffledIndex(position, total, seed):
+    """Seeded bijection on range(total): a balanced Feistel network with cycle-walking.
+
+    The network permutes the smallest 2k-bit range holding total; outputs beyond
+    total are fed through again until they land inside, which keeps it a
+    permutation of range(total) and needs no table, so a sweep stays lazy.
+    """
+    halfBits = max(1, ((total - 1).bit_length() + 1) // 2)
+    mask = (1 << halfBits) - 1
+    rng = random.Random(seed)
+    keys = [rng.getrandbits(64) for _ in range(feistelRounds)]
+    value = position
+    while True:
+        left, right = value >> halfBits, value & mask
+        for key in keys:
+            left, right = right, left ^ feistelRound(right, key, mask)
+        value = (left << halfBits) | right
+        if value < total:
+            return value
+
+def iterCombinations(choices, start=0, count=None, seed=None):
+    """Lazily yield (index, picks) from the Cartesian product of choices.
+
+    choices is a list of alternative lists. Each index is decoded directly as a
+    mixed-radix number so nothing is materialised and a sweep can resume at any
+    start index. With a seed the indices are walked in a reproducible shuffled
+    order (a Feistel permutation of the index range) instead.
+    """
+    total = math.prod(len(c) for c in choices)
+    shuffle = seed is not None and total > 1
+
+    stop = total if count is None else min(total, start + count)
+    for position in range(start, stop):
+        index = shuffledIndex(position, total, seed) if shuffle else position
+        remainder = index
+        picks = []
+        for alternatives in reversed(choices):
+            remainder, pick = divmod(remainder, len(alternatives))
+            picks.append(alternatives[pick])
+        picks.reverse()
+        yield index, picks
+
 class NoxinSplitPrompt:
     def __init__(self):
         pass
-    
+
     @classmethod
     def INPUT_TYPES(s):
-        
+
         return {
             "required": {
                 "loraword": ("STRING", {"display": "slider", "default": "","multiline": False}),
@@ -14,11 +147,17 @@ class NoxinSplitPrompt:
                 "photography": ("STRING", {"default": "","multiline": False}),
                 "face": ("STRING", {"default": "","multiline": False}),
                 "default_positive": ("STRING", {"default": "","multiline": False}),
-                "specific_negative": ("STRING", {"default": "","multiline": False}),   
-                "default_negative": ("STRING", {"default": "","multiline": False}),               
+                "specific_negative": ("STRING", {"default": "","multiline": False}),
+                "default_negative": ("STRING", {"default": "","multiline": False}),
                 "orderstring": ("STRING", {"default": "loraword,subject,clothing,setting,photography,face,default_positive","multiline": False}),
                 "delimiter": ("STRING", {"default": ",", "multiline": False}),
             },
+            "optional": {
+                # Additional named sections, one "name: value" per line, usable in orderstring
+                "extra_sections": ("STRING", {"default": "", "multiline": True}),
+                # Drop tokens that already appeared earlier in the prompt
+                "dedupe_tokens": ("BOOLEAN", {"default": False}),
+            },
         }
 
     RETURN_TYPES = ("STRING"  ,"STRING"  ,"STRING"   ,"STRING"  ,"STRING"      ,"STRING","STRING"           ,"STRING"           ,"STRING"          ,"STRING","STRING",)
@@ -27,32 +166,69 @@ class NoxinSplitPrompt:
     FUNCTION = "main"
     CATEGORY = "NoxinNodes"
 
-    def main(self, loraword, subject, clothing, setting, photography, face, default_positive, specific_negative, default_negative, orderstring, delimiter):      
-        sections = [loraword, subject, clothing, setting, photography, face, default_positive, specific_negative, default_negative]
-        sectionNames = ["loraword", "subject", "clothing", "setting", "photography", "face", "default_positive"]
-        
-        default_order = "loraword,subject,clothing,setting,photography,face,default_positive"
-        
-        orderstring = orderstring.replace(" ","") #strip spaces
-        orderstring = orderstring.lower()
-        orderstring = orderstring.split(",")
+    def main(self, loraword, subject, clothing, setting, photography, face, default_positive, specific_negative, default_negative, orderstring, delimiter, extra_sections="", dedupe_tokens=False):
+        sections = buildSections((loraword, subject, clothing, setting, photography, face, default_positive, specific_negative, default_negative), extra_sections)
         delim = delimiter
 
-        ind = 0
-        fullPrompt = ""
-        for sectionName in orderstring:
-            sectionIndex = sectionNames.index(sectionName)
-            sectionData = sections[sectionIndex]
-            fullPrompt = fullPrompt + sectionData
-            if ind < len(orderstring)-1 and sectionData != "":
-                fullPrompt = fullPrompt + delim
-
-            ind = ind + 1
+        template = compileTemplate(orderstring)
+        for sectionName, separator in template:
+            if sectionName not in sections:
+                print("Split Prompt: unknown section '" + sectionName + "' left empty")
 
-        postivePrompt = fullPrompt
-        negativePrompt = specific_negative + delim + default_negative
+        postivePrompt = renderTemplate(template, sections, delim, dedupe_tokens)
+        negativePrompt = renderTemplate(compileTemplate("specific_negative,default_negative"), sections, delim, dedupe_tokens)
 
         print("Combined Prompt+: " + postivePrompt)
         print("Combined Prompt-: " + negativePrompt)
 
         return (loraword, subject, clothing, setting, photography, face, default_positive, specific_negative, default_negative, postivePrompt, negativePrompt)
+
+class NoxinSplitPromptSweep:
+    """Expands sections holding several alternatives ("cat | dog | fox") into a list of prompts"""
+
+    def __init__(self):
+        pass
+
+    @classmethod
+    def INPUT_TYPES(s):
+        inputs = NoxinSplitPrompt.INPUT_TYPES()
+        inputs["required"].update({
+            "alternatives_separator": ("STRING", {"default": "|", "multiline": False}),
+            "mode": (["product", "random"], {"default": "product"}),
+            "seed": ("INT", {"default": 0, "min": 0, "max": 0xffffffffffffffff}),
+            # Resume a long sweep by setting start_index to the previous next_index
+            "start_index": ("INT", {"default": 0, "min": 0, "max": 0xffffffffffffffff}),
+            "count": ("INT", {"default": 16, "min": 1, "max": 4096}),
+        })
+        return inputs
+
+    RETURN_TYPES = ("STRING", "STRING", "INT", "INT", "INT",)
+    RETURN_NAMES = ("Combo+", "Combo-", "index", "next_index", "total",)
+    OUTPUT_IS_LIST = (True, True, True, False, False,)
+
+    FUNCTION = "main"
+    CATEGORY = "NoxinNodes"
+
+    def main(self, loraword, subject, clothing, setting, photography, face, default_positive, specific_negative, default_negative, orderstring, delimiter,
+             alternatives_separator, mode, seed, start_index, count, extra_sections="", dedupe_tokens=False):
+        sections = buildSections((loraword, subject, clothing, setting, photography, face, default_positive, specific_negative, default_negative), extra_sections)
+        template = compileTemplate(orderstring)
+        negativeTemplate = compileTemplate("specific_negative,default_negative")
+
+        # Only sections the templates use are swept, unused ones would just repeat combinations
+        names = list(dict.fromkeys(name for name, separator in template + negativeTemplate if name in sections))
+        choices = [splitAlternatives(sections[name], alternatives_separator) for name in names]
+        total = math.prod(len(c) for c in choices)
+
+        positives, negatives, indices = [], [], []
+        for index, picks in iterCombinations(choices, start_index, count, seed if mode == "random" else None):
+            picked = dict(zip(names, picks))
+            positives.append(renderTemplate(template, picked, delimiter, dedupe_tokens))
+            negatives.append(renderTemplate(negativeTemplate, picked, delimiter, dedupe_tokens))
+            indices.append(index)
+
+        nextIndex = start_index + len(indices)
+        print("Split Prompt Sweep: " + str(len(indices)) + " of " + str(total) + " combinations, next index " + str(nextIndex))
+        if not indices:
+            return ([""], [""], [-1], nextIndex, total)
+        return (positives, negatives, indices, nextIndex, total)